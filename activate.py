@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v2.0 (see COPYING or https://www.gnu.org/licenses/gpl-2.0.txt)
+''' This Kodi script activates the screensaver, so it can be started remotely using RunAddon '''
+
+from __future__ import absolute_import, division, unicode_literals
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'lib'))
+
+if __name__ == '__main__':
+    from kodiutils import NOTIFIER, run_builtin
+    try:
+        # NOTE: Kodi then runs the configured screensaver like it does when idle, so any input resumes it
+        run_builtin('ActivateScreensaver')
+    finally:
+        NOTIFIER.flush()
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v2.0 (see COPYING or https://www.gnu.org/licenses/gpl-2.0.txt)
+''' Turn many Kodi displays off or on at once over JSON-RPC (requires Python 3.7+) '''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import asyncio
+import codecs
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'lib'))
+from kodiutils import ADDON_ID, jsonrpc_payload  # noqa: E402; pylint: disable=wrong-import-position
+from remote import decode_jsonrpc_stream, method_by_name  # noqa: E402; pylint: disable=wrong-import-position
+from turnoff import POWER_METHODS  # noqa: E402; pylint: disable=wrong-import-position
+
+
+def read_inventory(path):
+    ''' Read a host inventory, one host[:port] per line, # starts a comment '''
+    hosts = []
+    with open(path) as fdesc:
+        for line in fdesc:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            host, _, port = line.partition(':')
+            hosts.append((host, int(port or 9090)))
+    return hosts
+
+
+def action_payloads(action, power='do-nothing', mute=False):
+    ''' Build the JSON-RPC payloads for a fleet action '''
+    if action == 'off':
+        power_method = method_by_name(POWER_METHODS, power)
+        # NOTE: RunAddon only starts scripts, so the script entry point has Kodi activate its configured screensaver
+        payloads = [dict(method='Addons.ExecuteAddon', params=dict(addonid=ADDON_ID))]
+        if mute:
+            payloads.append(dict(method='Application.SetMute', params=dict(mute=True)))
+        if power_method.get('function') == 'jsonrpc':
+            payloads.append(power_method.get('kwargs_off'))
+        return payloads
+    if action == 'on':
+        # NOTE: Any input deactivates the screensaver, which turns the display back on
+        payloads = [dict(method='Input.Home')]
+        if mute:
+            payloads.insert(0, dict(method='Application.SetMute', params=dict(mute=False)))
+        return payloads
+    if action == 'status':
+        return [
+            dict(method='JSONRPC.Ping'),
+            dict(method='Application.GetProperties', params=dict(properties=['muted'])),
+            dict(method='XBMC.GetInfoBooleans', params=dict(booleans=['System.ScreenSaverActive'])),
+        ]
+    raise ValueError("Unknown action '{action}'".format(action=action))
+
+
+class FleetHost(object):
+    ''' A persistent, pipelined JSON-RPC connection to a single Kodi host '''
+
+    def __init__(self, host, port=9090):
+        ''' Initialize host '''
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.buffer = ''
+        self.decoder = None
+        self.request_id = 0
+
+    def __str__(self):
+        ''' The host:port of this host '''
+        return '{host}:{port}'.format(host=self.host, port=self.port)
+
+    async def pipeline(self, payloads):
+        ''' Send all payloads at once, connecting if needed, and return their responses in order '''
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.buffer = ''
+            self.decoder = codecs.getincrementaldecoder('utf-8')()
+        request_ids = []
+        for payload in payloads:
+            self.request_id += 1
+            request_ids.append(self.request_id)
+            self.writer.write(json.dumps(dict(jsonrpc_payload(**payload), id=self.request_id)).encode('utf-8'))
+        await self.writer.drain()
+        responses = {}
+        while not all(request_id in responses for request_id in request_ids):
+            data = await self.reader.read(65536)
+            if not data:
+                raise ConnectionError('Connection closed by {host}'.format(host=self))
+            messages, self.buffer = decode_jsonrpc_stream(self.buffer + self.decoder.decode(data))
+            for message in messages:
+                if message.get('id') is not None:
+                    responses[message.get('id')] = message
+        return [responses[request_id] for request_id in request_ids]
+
+    async def close(self):
+        ''' Close the connection, it is reopened on next use '''
+        writer, self.reader, self.writer = self.writer, None, None
+        if writer is None:
+            return
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+class Fleet(object):
+    ''' Run JSON-RPC actions on many Kodi hosts concurrently '''
+
+    def __init__(self, hosts, concurrency=16, timeout=5):
+        ''' Initialize fleet '''
+        self.hosts = [FleetHost(host, port) for host, port in hosts]
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    async def run_host(self, semaphore, host, payloads):
+        ''' Run payloads on a single host within the per-host timeout '''
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                responses = await asyncio.wait_for(host.pipeline(payloads), self.timeout)
+            except asyncio.TimeoutError:
+                # NOTE: Late responses would confuse the next action, start over
+                await host.close()
+                error = 'timed out after {timeout}s'.format(timeout=self.timeout)
+                responses = None
+            except (OSError, ValueError) as exc:
+                await host.close()
+                error = str(exc) or exc.__class__.__name__
+                responses = None
+            else:
+                errors = [response.get('error').get('message') for response in responses if 'error' in response]
+                error = '; '.join(errors) if errors else None
+            return dict(host=str(host), ok=error is None, latency=time.perf_counter() - start, error=error,
+                        results=[response.get('result') for response in responses or []])
+
+    async def run(self, payloads):
+        ''' Run payloads on all hosts with bounded concurrency '''
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[self.run_host(semaphore, host, payloads) for host in self.hosts])
+
+    async def close(self):
+        ''' Close all connections '''
+        await asyncio.gather(*[host.close() for host in self.hosts])
+
+
+def report(action, results, stream=sys.stdout):
+    ''' Print per-host results and an aggregated success and latency summary '''
+    for result in sorted(results, key=lambda result: result.get('host')):
+        if result.get('ok'):
+            status, detail = 'ok', json.dumps(result.get('results'))
+        else:
+            status, detail = 'FAIL', result.get('error')
+        print('{host:<30} {status:<5} {latency:8.1f}ms {detail}'.format(host=result.get('host'), status=status,
+                                                                        latency=result.get('latency') * 1000, detail=detail), file=stream)
+    latencies = sorted(result.get('latency') for result in results if result.get('ok'))
+    succeeded = len(latencies)
+    summary = '{action}: {ok}/{total} hosts succeeded'.format(action=action, ok=succeeded, total=len(results))
+    if latencies:
+        summary += ', latency min={min:.1f}ms median={median:.1f}ms p95={p95:.1f}ms max={max:.1f}ms'.format(
+            min=latencies[0] * 1000,
+            median=latencies[len(latencies) // 2] * 1000,
+            p95=latencies[max(int(succeeded * 0.95) - 1, 0)] * 1000,
+            max=latencies[-1] * 1000,
+        )
+    print(summary, file=stream)
+    return succeeded == len(results)
+
+
+async def run_action(hosts, action, power='do-nothing', mute=False, **kwargs):
+    ''' Run a single action on all hosts, returns the per-host results '''
+    fleet = Fleet(hosts, **kwargs)
+    try:
+        return await fleet.run(action_payloads(action, power=power, mute=mute))
+    finally:
+        await fleet.close()
+
+
+async def run_fleet(hosts, actions, concurrency=16, timeout=5, power='do-nothing', mute=False, stream=sys.stdout):  # pylint: disable=too-many-arguments
+    ''' Run actions in order on all hosts, reusing connections between actions '''
+    fleet = Fleet(hosts, concurrency=concurrency, timeout=timeout)
+    success = True
+    try:
+        for action in actions:
+            results = await fleet.run(action_payloads(action, power=power, mute=mute))
+            success = report(action, results, stream=stream) and success
+    finally:
+        await fleet.close()
+    return success
+
+
+def main(argv=None):
+    ''' Turn many Kodi displays off or on at once '''
+    from argparse import ArgumentParser
+    parser = ArgumentParser(prog='fleet.py', description=main.__doc__)
+    parser.add_argument('inventory', help='File with one host[:port] per line')
+    parser.add_argument('actions', nargs='+', choices=['off', 'on', 'status'], help='Actions to run in order')
+    parser.add_argument('--concurrency', type=int, default=16, help='Maximum number of hosts in flight (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=5, help='Per-host timeout in seconds (default: %(default)s)')
+    parser.add_argument('--power', default='do-nothing', help='Power method to use when off (default: %(default)s)')
+    parser.add_argument('--mute', action='store_true', help='Mute audio when off, unmute when on')
+    args = parser.parse_args(argv)
+    try:
+        method_by_name(POWER_METHODS, args.power)
+        hosts = read_inventory(args.inventory)
+    except (IOError, ValueError) as exc:
+        parser.error(str(exc))
+    success = asyncio.run(run_fleet(hosts, args.actions, concurrency=args.concurrency, timeout=args.timeout, power=args.power, mute=args.mute))
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
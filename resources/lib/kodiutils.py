@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v2.0 (see COPYING or https://www.gnu.org/licenses/gpl-2.0.txt)
+''' Kodi helpers shared by the TurnOff screensaver, its service and its command-line interface '''
+
+from __future__ import absolute_import, division, unicode_literals
+import os
+import sys
+
+try:
+    from xbmc import executebuiltin, executeJSONRPC, log as xlog, translatePath
+    from xbmcaddon import Addon
+except ImportError:  # NOTE: Running outside of Kodi, only the command-line interface is available
+    Addon = executebuiltin = executeJSONRPC = None
+
+    def xlog(msg, level):  # pylint: disable=unused-argument
+        ''' Log messages to stderr '''
+        sys.stderr.write(msg + '\n')
+
+    def translatePath(path):  # pylint: disable=invalid-name
+        ''' Paths need no translation outside of Kodi '''
+        return path
+
+
+class SafeDict(dict):
+    ''' A safe dictionary implementation that does not break down on missing keys '''
+    def __missing__(self, key):
+        ''' Replace missing keys with the original placeholder '''
+        return '{' + key + '}'
+
+
+def from_unicode(text, encoding='utf-8'):  # pylint: disable=unused-argument
+    ''' Force unicode to text '''
+    return text
+
+
+# BEGIN PY2: Stripped from Python 3 builds, see scripts/build_py3.py
+if sys.version_info.major == 2:
+    def from_unicode(text, encoding='utf-8'):  # noqa: F811; pylint: disable=function-redefined
+        ''' Force unicode to text '''
+        if isinstance(text, unicode):  # noqa: F821; pylint: disable=undefined-variable
+            return text.encode(encoding)
+        return text
+# END PY2
+
+
+def to_unicode(text, encoding='utf-8'):
+    ''' Force text to unicode '''
+    return text.decode(encoding) if isinstance(text, bytes) else text
+
+
+def log(level=1, msg='', **kwargs):
+    ''' Log info messages to Kodi '''
+    if not DEBUG_LOGGING and not (level <= MAX_LOG_LEVEL or MAX_LOG_LEVEL == 0):
+        return
+    from string import Formatter
+    if kwargs:
+        msg = Formatter().vformat(msg, (), SafeDict(**kwargs))
+    msg = '[{addon}] {msg}'.format(addon=ADDON_ID, msg=msg)
+    xlog(from_unicode(msg), level % 3 if DEBUG_LOGGING else 2)
+
+
+def log_error(msg, **kwargs):
+    ''' Log error messages to Kodi '''
+    from string import Formatter
+    if kwargs:
+        msg = Formatter().vformat(msg, (), SafeDict(**kwargs))
+    msg = '[{addon}] {msg}'.format(addon=ADDON_ID, msg=msg)
+    xlog(from_unicode(msg), 4)
+
+
+def traced(function):
+    ''' Record calls and their latency when an activation cycle is being traced '''
+    from functools import wraps
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        ''' Time the call when tracing '''
+        from time import time
+        if not TRACE.active:
+            return function(*args, **kwargs)
+        start = time()
+        error = None
+        try:
+            return function(*args, **kwargs)
+        except SystemExit as exc:
+            error = 'exit {code}'.format(code=exc.code)
+            raise
+        except Exception as exc:
+            error = exc.__class__.__name__
+            raise
+        finally:
+            TRACE.call(function.__name__, kwargs.get('method') or ' '.join(args), start, time() - start, error)
+    return wrapper
+
+
+def jsonrpc_payload(**kwargs):
+    ''' Build a JSONRPC request payload '''
+    if 'id' not in kwargs:
+        kwargs.update(id=1)
+    if 'jsonrpc' not in kwargs:
+        kwargs.update(jsonrpc='2.0')
+    return kwargs
+
+
+@traced
+def jsonrpc(**kwargs):
+    ''' Perform JSONRPC calls '''
+    from json import dumps, loads
+    kwargs = jsonrpc_payload(**kwargs)
+    result = loads(executeJSONRPC(dumps(kwargs)))
+    log(3, msg="Sending JSON-RPC payload: '{payload}' returns '{result}'", payload=kwargs, result=result)
+    return result
+
+
+class Notifier(object):
+    ''' Show notifications from a background worker, collapsing repeats and rate-limiting them per key '''
+
+    def __init__(self, path=None, interval=None):
+        ''' Initialize notifier, the worker only starts on the first notification '''
+        import threading
+        self.path = path
+        self.interval = NOTIFY_INTERVAL if interval is None else interval
+        self.lock = threading.Lock()
+        self.pending = []
+        self.sent = None
+        self.worker = None
+
+    def notify(self, key, heading, msg, delay, icon):
+        ''' Queue a notification, repeats of a pending notification are only counted '''
+        import threading
+        with self.lock:
+            for notification in self.pending:
+                if notification[0] == key:
+                    notification[2] = msg
+                    notification[5] += 1
+                    break
+            else:
+                self.pending.append([key, heading, msg, delay, icon, 1])
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name='notifier')
+                self.worker.daemon = True
+                self.worker.start()
+
+    def load(self):
+        ''' Read when each key was last notified and how often it was suppressed since, so rate-limiting spans activations '''
+        from json import loads
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'rb') as fdesc:
+                sent = loads(fdesc.read().decode('utf-8'))
+            # NOTE: Older state only holds when each key was last notified
+            return {key: value if isinstance(value, list) else [value, 0] for key, value in sent.items()}
+        except (AttributeError, IOError, OSError, ValueError) as exc:
+            log_error(msg="Ignoring notification state '{path}': {exc}", path=self.path, exc=exc)
+            return {}
+
+    def save(self):
+        ''' Write when each key was last notified and how often it was suppressed since '''
+        from json import dumps
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        atomic_write(self.path, dumps(self.sent, sort_keys=True).encode('utf-8'))
+
+    def run(self):
+        ''' Drain the queue until it is empty '''
+        import threading
+        try:
+            while True:
+                with self.lock:
+                    if not self.pending:
+                        self.worker = None
+                        return
+                    notification = self.pending.pop(0)
+                try:
+                    self.deliver(notification)
+                except Exception as exc:  # pylint: disable=broad-except
+                    log_error(msg="Unable to show notification '{notification}': {exc}", notification=notification[2], exc=exc)
+        finally:
+            # NOTE: A worker that dies must not keep later notifications from starting a new one
+            with self.lock:
+                if self.worker is threading.current_thread():
+                    self.worker = None
+
+    def deliver(self, notification):
+        ''' Show a notification unless its key is rate-limited, then count it towards the next one '''
+        from time import time
+        key, heading, msg, delay, icon, count = notification
+        if self.sent is None:
+            self.sent = self.load()
+        last, suppressed = self.sent.get(key, (0, 0))
+        if time() - last < self.interval:
+            log(2, msg="Suppressed notification '{notification}' ({count}x)", notification=msg, count=count)
+            self.sent[key] = [last, suppressed + count]
+            self.save()
+            return
+        count += suppressed
+        if count > 1:
+            msg = '{msg} ({count}x)'.format(msg=msg, count=count)
+        self.show(heading, msg, delay, icon)
+        self.sent[key] = [time(), 0]
+        self.save()
+
+    @staticmethod
+    def show(heading, msg, delay, icon):
+        ''' Bring up the Kodi notification '''
+        try:
+            from xbmcgui import Dialog
+        except ImportError:  # NOTE: Outside of Kodi errors are only logged
+            return
+        Dialog().notification(heading, msg, icon, delay)
+
+    def flush(self, timeout=None):
+        ''' Wait for queued notifications to be shown '''
+        worker = self.worker
+        if worker is not None:
+            worker.join(NOTIFY_FLUSH_TIMEOUT if timeout is None else timeout)
+
+
+def popup(heading='', msg='', delay=10000, icon='', key=None):
+    ''' Bring up a pop-up with a meaningful error, without waiting for it '''
+    if not heading:
+        heading = 'Addon {addon} failed'.format(addon=ADDON_ID)
+    if not icon:
+        icon = ADDON_ICON
+    NOTIFIER.notify(key or msg, heading, msg, delay, icon)
+
+
+@traced
+def run_builtin(builtin):
+    ''' Run Kodi builtins while catching exceptions '''
+    log(2, msg="Executing builtin '{builtin}'", builtin=builtin)
+    try:
+        executebuiltin(builtin, True)
+    except Exception as exc:  # pylint: disable=broad-except
+        log_error(msg="Exception executing builtin '{builtin}': {exc}", builtin=builtin, exc=exc)
+        popup(msg="Exception executing builtin '%s': %s" % (builtin, exc), key=builtin)
+        return False
+    return True
+
+
+@traced
+def run_command(*command, **kwargs):
+    ''' Run commands on the OS while catching exceptions '''
+    # TODO: Add options for running using su or sudo
+    import subprocess
+    try:
+        cmd = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs)
+        (out, err) = cmd.communicate()
+        if cmd.returncode == 0:
+            log(2, msg="Running command '{command}' returned rc={rc}", command=' '.join(command), rc=cmd.returncode)
+        else:
+            log_error(msg="Running command '{command}' failed with rc={rc}", command=' '.join(command), rc=cmd.returncode)
+            if err:
+                log_error(msg="Command '{command}' returned on stderr: {stderr}", command=command[0], stderr=err)
+            if out:
+                log_error(msg="Command '{command}' returned on stdout: {stdout} ", command=command[0], stdout=out)
+            popup(msg="%s\n%s" % (out, err), key=command[0])
+            sys.exit(1)
+    except Exception as exc:  # pylint: disable=broad-except
+        log_error(msg="Exception running '{command}': {exc}", command=command[0], exc=exc)
+        popup(msg="Exception running '%s': %s" % (command[0], exc), key=command[0])
+        sys.exit(2)
+
+
+def atomic_write(path, data):
+    ''' Replace a file with new content so that readers never see a partial write '''
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fdesc:
+        fdesc.write(data)
+        fdesc.flush()
+        os.fsync(fdesc.fileno())
+    # NOTE: Python 2 on Windows cannot rename over an existing file
+    if not hasattr(os, 'replace') and os.path.exists(path):
+        os.remove(path)
+    getattr(os, 'replace', os.rename)(tmp_path, path)
+
+
+def rotate_files(directory, keep, max_size):
+    ''' Remove the oldest files from a directory beyond a count or total size '''
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    total_size = 0
+    for index, path in enumerate(paths):
+        total_size += os.path.getsize(path)
+        # NOTE: The newest file is always kept
+        if index and (index >= keep or total_size > max_size):
+            os.remove(path)
+
+
+class ActivationProfiler(object):
+    ''' Capture cProfile statistics and top allocations for one activation cycle '''
+
+    def __init__(self):
+        ''' Initialize profiler '''
+        self.profile = None
+        self.tracemalloc = None
+
+    @staticmethod
+    def enabled():
+        ''' Whether the next activation cycle needs to be profiled '''
+        return bool(os.environ.get('TURNOFF_PROFILE')) or ADDON.getSetting('profile') == 'true'
+
+    def start(self):
+        ''' Start profiling '''
+        from cProfile import Profile
+        try:
+            import tracemalloc
+        except ImportError:  # Python 2
+            pass
+        else:
+            self.tracemalloc = tracemalloc
+            tracemalloc.start()
+        self.profile = Profile()
+        self.profile.enable()
+
+    def stop(self):
+        ''' Stop profiling and write out the reports, unless this activation cycle was not profiled '''
+        from time import strftime
+        profile, self.profile = self.profile, None
+        if not profile:
+            return
+        profile.disable()
+        if not os.path.isdir(PROFILE_DIR):
+            os.makedirs(PROFILE_DIR)
+        basename = os.path.join(PROFILE_DIR, 'activation-{stamp}'.format(stamp=strftime('%Y%m%d-%H%M%S')))
+        profile.dump_stats(basename + '.pstats')
+        if self.tracemalloc:
+            statistics = self.tracemalloc.take_snapshot().statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]
+            self.tracemalloc.stop()
+            with open(basename + '.allocations.txt', 'w') as fdesc:
+                fdesc.write('\n'.join(str(statistic) for statistic in statistics) + '\n')
+        rotate_files(PROFILE_DIR, keep=PROFILE_KEEP, max_size=PROFILE_MAX_SIZE)
+        log(1, msg="Wrote activation profile to '{path}'", path=basename + '.pstats')
+        # Only profile a single activation cycle
+        if ADDON.getSetting('profile') == 'true':
+            ADDON.setSetting('profile', 'false')
+
+
+class TraceRecorder(object):
+    ''' Record the event sequence and call latencies of an activation cycle in a compact trace file '''
+    VERSION = 1
+
+    def __init__(self):
+        ''' Initialize recorder '''
+        self.active = False
+        self.directory = None
+        self.events = []
+        self.header = {}
+        self.start_time = 0
+
+    @staticmethod
+    def enabled():
+        ''' Whether activation cycles need to be traced '''
+        return bool(os.environ.get('TURNOFF_TRACE')) or ADDON.getSetting('trace') == 'true'
+
+    def start(self, **header):
+        ''' Start recording, the header describes the configuration to replay '''
+        from time import time
+        self.start_time = time()
+        self.header = dict(header, version=self.VERSION, start=self.start_time)
+        self.events = []
+        self.active = True
+
+    def event(self, name):
+        ''' Record an event '''
+        from time import time
+        if self.active:
+            self.events.append([round(time() - self.start_time, 4), 'event', name, 0, None])
+
+    def call(self, kind, name, start, latency, error=None):
+        ''' Record a completed call '''
+        self.events.append([round(start - self.start_time, 4), kind, name, round(latency, 4), error])
+
+    def stop(self):
+        ''' Stop recording and write out the trace, one JSON array per event '''
+        from json import dumps
+        from time import strftime
+        if not self.active:
+            return None
+        self.active = False
+        directory = self.directory or TRACE_DIR
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, 'trace-{stamp}.jsonl'.format(stamp=strftime('%Y%m%d-%H%M%S')))
+        with open(path, 'w') as fdesc:
+            fdesc.write(dumps(self.header, sort_keys=True) + '\n')
+            for event in self.events:
+                fdesc.write(dumps(event, separators=(',', ':')) + '\n')
+        rotate_files(directory, keep=TRACE_KEEP, max_size=TRACE_MAX_SIZE)
+        log(2, msg="Wrote activation trace to '{path}'", path=path)
+        return path
+
+
+def func(function, *args, **kwargs):
+    ''' Execute a global function with arguments '''
+    return globals()[function](*args, **kwargs)
+
+
+if Addon:
+    ADDON = Addon()
+    ADDON_NAME = to_unicode(ADDON.getAddonInfo('name'))
+    ADDON_ID = to_unicode(ADDON.getAddonInfo('id'))
+    ADDON_PATH = to_unicode(ADDON.getAddonInfo('path'))
+    ADDON_ICON = to_unicode(ADDON.getAddonInfo('icon'))
+    ADDON_PROFILE = to_unicode(translatePath(ADDON.getAddonInfo('profile')))
+else:
+    ADDON = None
+    ADDON_NAME = 'Turn Off'
+    ADDON_ID = 'screensaver.turnoff'
+    ADDON_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    ADDON_ICON = os.path.join(ADDON_PATH, 'resources', 'media', 'icon.png')
+    ADDON_PROFILE = os.path.join(os.path.expanduser('~'), '.kodi', 'userdata', 'addon_data', ADDON_ID)
+NOTIFY_FLUSH_TIMEOUT = 5
+NOTIFY_INTERVAL = 600
+NOTIFIER = Notifier(os.path.join(ADDON_PROFILE, 'notifications.json'))
+PROFILE_DIR = os.path.join(ADDON_PROFILE, 'profiles')
+PROFILE_KEEP = 10
+PROFILE_MAX_SIZE = 4 * 1024 * 1024
+PROFILE_TOP_ALLOCATIONS = 50
+PROFILER = ActivationProfiler()
+TRACE = TraceRecorder()
+TRACE_DIR = os.path.join(ADDON_PROFILE, 'traces')
+TRACE_KEEP = 20
+TRACE_MAX_SIZE = 1024 * 1024
+
+DEBUG_LOGGING = True
+MAX_LOG_LEVEL = 3
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v2.0 (see COPYING or https://www.gnu.org/licenses/gpl-2.0.txt)
+''' Control a Kodi system running the TurnOff screensaver from the command-line over JSON-RPC '''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from kodiutils import ADDON, ADDON_PATH, func, jsonrpc_payload, log_error
+from turnoff import DISPLAY_METHODS, POWER_METHODS, TurnOffDialog, TurnOffWindow
+
+
+def decode_jsonrpc_stream(data):
+    ''' Split a stream of concatenated JSONRPC messages, returns the complete messages and the remainder '''
+    from json import JSONDecoder
+    decoder = JSONDecoder()
+    messages = []
+    data = data.lstrip()
+    while data:
+        try:
+            message, end = decoder.raw_decode(data)
+        except ValueError:  # Incomplete message
+            break
+        messages.append(message)
+        data = data[end:].lstrip()
+    return messages, data
+
+
+class JSONRPCConnection(object):
+    ''' A persistent JSONRPC connection to Kodi over TCP with request pipelining '''
+
+    def __init__(self, host='localhost', port=9090, timeout=10):
+        ''' Initialize connection '''
+        self.address = (host, port)
+        self.timeout = timeout
+        self.sock = None
+        self.buffer = ''
+        self.decoder = None
+        self.request_id = 0
+        self.responses = {}
+
+    def connect(self):
+        ''' Open the connection, unless it is already open '''
+        import socket
+        from codecs import getincrementaldecoder
+        if self.sock:
+            return
+        self.sock = socket.create_connection(self.address, self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = ''
+        self.decoder = getincrementaldecoder('utf-8')()
+
+    def close(self):
+        ''' Close the connection '''
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def pipeline(self, payloads):
+        ''' Send a list of JSONRPC payloads at once and return their responses in order '''
+        from json import dumps
+        self.connect()
+        request_ids = []
+        requests = []
+        for payload in payloads:
+            self.request_id += 1
+            request_ids.append(self.request_id)
+            requests.append(dumps(dict(jsonrpc_payload(**payload), id=self.request_id)))
+        try:
+            self.sock.sendall(''.join(requests).encode('utf-8'))
+            while not all(request_id in self.responses for request_id in request_ids):
+                self.receive()
+        except Exception:
+            self.close()
+            raise
+        responses = []
+        for payload, request_id in zip(payloads, request_ids):
+            response = self.responses.pop(request_id)
+            response.update(id=payload.get('id', 1))
+            responses.append(response)
+        return responses
+
+    def receive(self):
+        ''' Read the next chunk of data and decode all complete JSONRPC messages '''
+        data = self.sock.recv(65536)
+        if not data:
+            raise IOError('Connection closed by {0}:{1}'.format(*self.address))
+        messages, self.buffer = decode_jsonrpc_stream(self.buffer + self.decoder.decode(data))
+        # NOTE: Kodi notifications carry no id, the command-line interface has no use for them
+        for message in messages:
+            if message.get('id') is not None:
+                self.responses[message.get('id')] = message
+
+    def call(self, **kwargs):
+        ''' Perform a single JSONRPC call '''
+        return self.pipeline([kwargs])[0]
+
+
+def method_by_name(methods, name):
+    ''' Look up a display or power method by its name '''
+    for method in methods:
+        if method.get('name') == name:
+            return method
+    raise ValueError("Unknown method '{name}', choose from: {names}".format(name=name, names=', '.join(m.get('name') for m in methods)))
+
+
+def cli_off(connection, args):
+    ''' Turn the display off and optionally mute audio and power off the system '''
+    display = method_by_name(DISPLAY_METHODS, args.display)
+    power = method_by_name(POWER_METHODS, args.power)
+    if display.get('function') == 'run_builtin':
+        raise ValueError("Display method '{name}' requires Kodi builtins and cannot be used from the command-line".format(name=args.display))
+    func(display.get('function'), *display.get('args_off'))
+    payloads = []
+    if args.mute:
+        payloads.append(dict(method='Application.SetMute', params=dict(mute=True)))
+    if power.get('function') == 'jsonrpc':
+        payloads.append(power.get('kwargs_off'))
+    return connection.pipeline(payloads) if payloads else []
+
+
+def cli_on(connection, args):
+    ''' Turn the display back on and optionally unmute audio '''
+    display = method_by_name(DISPLAY_METHODS, args.display)
+    if display.get('function') == 'run_builtin':
+        raise ValueError("Display method '{name}' requires Kodi builtins and cannot be used from the command-line".format(name=args.display))
+    responses = connection.pipeline([dict(method='Application.SetMute', params=dict(mute=False))]) if args.mute else []
+    func(display.get('function'), *display.get('args_on'))
+    return responses
+
+
+def cli_status(connection, args):  # pylint: disable=unused-argument
+    ''' Report whether Kodi is reachable, muted and running its screensaver '''
+    return connection.pipeline([
+        dict(method='JSONRPC.Ping'),
+        dict(method='Application.GetProperties', params=dict(properties=['muted', 'volume', 'name', 'version'])),
+        dict(method='XBMC.GetInfoBooleans', params=dict(booleans=['System.ScreenSaverActive'])),
+    ])
+
+
+def bench_activation(factory, start, count):
+    ''' Measure the time from creating a screensaver window until its display command is issued '''
+    from time import time
+    timings = []
+    for _ in range(count):
+        begin = time()
+        window = factory()
+        getattr(window, start)()
+        timings.append(window.cycle.display_off_time - begin)
+        window.resume()
+    timings.sort()
+    return dict(min=timings[0], avg=sum(timings) / len(timings), max=timings[-1])
+
+
+def cli_bench(connection, args):
+    ''' Measure JSONRPC round-trip latency, sequential and pipelined '''
+    from time import time
+    timings = []
+    for _ in range(args.count):
+        start = time()
+        connection.call(method='JSONRPC.Ping')
+        timings.append(time() - start)
+    start = time()
+    connection.pipeline([dict(method='JSONRPC.Ping')] * args.count)
+    pipelined = time() - start
+    timings.sort()
+    report = dict(
+        count=args.count,
+        sequential=dict(min=timings[0], avg=sum(timings) / len(timings), p95=timings[max(int(len(timings) * 0.95) - 1, 0)], max=timings[-1]),
+        pipelined=dict(total=pipelined, avg=pipelined / args.count),
+    )
+    # NOTE: Activations can only be measured with the Kodi modules available
+    if ADDON and args.activations:
+        report.update(time_to_first_command=dict(
+            xml=bench_activation(lambda: TurnOffDialog('gui.xml', ADDON_PATH, 'default'), 'onInit', args.activations),
+            code=bench_activation(TurnOffWindow, 'activate', args.activations),
+        ))
+    return [dict(id=1, jsonrpc='2.0', result=report)]
+
+
+CLI_COMMANDS = dict(
+    off=cli_off,
+    on=cli_on,
+    status=cli_status,
+    bench=cli_bench,
+)
+
+
+def cli(argv=None):
+    ''' Control a Kodi system from the command-line over JSONRPC '''
+    from argparse import ArgumentParser
+    from json import dumps
+    import kodiutils
+
+    parser = ArgumentParser(prog='screensaver.py', description=cli.__doc__)
+    parser.add_argument('command', choices=sorted(CLI_COMMANDS))
+    parser.add_argument('--host', default='localhost', help='Kodi host (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=9090, help='Kodi JSONRPC TCP port (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=10, help='Connection timeout in seconds (default: %(default)s)')
+    parser.add_argument('--display', default='do-nothing', help='Display method, run locally (default: %(default)s)')
+    parser.add_argument('--power', default='do-nothing', help='Power method (default: %(default)s)')
+    parser.add_argument('--mute', action='store_true', help='Mute audio when off, unmute when on')
+    parser.add_argument('--count', type=int, default=100, help='Number of benchmark iterations (default: %(default)s)')
+    parser.add_argument('--activations', type=int, default=10, help='Number of benchmark activations, when Kodi modules are available (default: %(default)s)')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Log everything to stderr')
+    args = parser.parse_args(argv)
+
+    saved = (kodiutils.DEBUG_LOGGING, kodiutils.MAX_LOG_LEVEL)
+    kodiutils.DEBUG_LOGGING = args.verbose
+    kodiutils.MAX_LOG_LEVEL = 3 if args.verbose else 1
+    connection = JSONRPCConnection(args.host, args.port, args.timeout)
+    try:
+        responses = CLI_COMMANDS.get(args.command)(connection, args)
+    except (IOError, OSError, ValueError) as exc:
+        log_error(msg='{command} failed: {exc}', command=args.command, exc=exc)
+        return 1
+    finally:
+        connection.close()
+        kodiutils.DEBUG_LOGGING, kodiutils.MAX_LOG_LEVEL = saved
+    for response in responses:
+        print(dumps(response.get('result', response), sort_keys=True))
+    return 1 if any('error' in response for response in responses) else 0
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v2.0 (see COPYING or https://www.gnu.org/licenses/gpl-2.0.txt)
+''' The tasks the TurnOff screensaver finishes before powering off the system '''
+
+from __future__ import absolute_import, division, unicode_literals
+import os
+
+from kodiutils import jsonrpc, log, log_error, to_unicode
+
+
+def next_wake_time(wake_time, now=None, lead=0):
+    ''' Return the timestamp of the next occurrence of a HH:MM wall-clock time that is more than lead seconds away '''
+    from datetime import datetime, timedelta
+    from time import mktime, time
+    hour, minute = (int(part) for part in wake_time.split(':'))
+    now = datetime.fromtimestamp(now if now is not None else time())
+    wake = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    # NOTE: The wake alarm goes off lead seconds earlier, and must not be in the past
+    if wake - timedelta(seconds=lead) <= now:
+        wake += timedelta(days=1)
+    return mktime(wake.timetuple())
+
+
+def set_wakealarm(timestamp, rtc_root=None):
+    ''' Program the RTC to wake up the system at a given timestamp '''
+    from glob import glob
+    import subprocess
+    paths = sorted(glob(os.path.join(rtc_root or RTC_ROOT, 'rtc*', 'wakealarm')))
+    if not paths:
+        log(2, msg="No RTC found in '{rtc_root}', using rtcwake", rtc_root=rtc_root or RTC_ROOT)
+        try:
+            subprocess.check_call(['rtcwake', '-m', 'no', '-t', str(int(timestamp))])
+        except (OSError, subprocess.CalledProcessError) as exc:
+            log_error(msg='Unable to set RTC wake alarm using rtcwake: {exc}', exc=exc)
+            return False
+        return True
+    try:
+        # NOTE: An already armed alarm has to be cleared first
+        with open(paths[0], 'w') as fdesc:
+            fdesc.write('0')
+        with open(paths[0], 'w') as fdesc:
+            fdesc.write(str(int(timestamp)))
+    except (IOError, OSError) as exc:
+        log_error(msg="Unable to set RTC wake alarm '{path}': {exc}", path=paths[0], exc=exc)
+        return False
+    log(1, msg="Set RTC wake alarm '{path}' to {timestamp}", path=paths[0], timestamp=int(timestamp))
+    return True
+
+
+def stop_players():
+    ''' Stop all active players, so nothing is playing when the system powers off '''
+    for player in jsonrpc(method='Player.GetActivePlayers').get('result') or []:
+        log(1, msg="Stop {player} player", player=player.get('type'))
+        jsonrpc(method='Player.Stop', params=dict(playerid=player.get('playerid')))
+    return True
+
+
+def sync_filesystems():
+    ''' Flush pending writes, so powering off does not stall on I/O '''
+    if hasattr(os, 'sync'):
+        os.sync()
+        return True
+    import subprocess
+    return subprocess.call(['sync']) == 0
+
+
+def verify_display_off(display, timeout):
+    ''' Poll the display until it reports being off, for display methods that can be queried '''
+    import subprocess
+    from time import sleep, time
+    deadline = time() + timeout
+    while True:
+        try:
+            output = subprocess.Popen(display.get('verify'), stdout=subprocess.PIPE, stderr=subprocess.STDOUT).communicate()[0]
+        except OSError as exc:
+            log_error(msg="Unable to verify display using '{command}': {exc}", command=display.get('verify')[0], exc=exc)
+            return False
+        if display.get('verify_off') in to_unicode(output):
+            return True
+        if time() >= deadline:
+            log_error(msg="Display is still on using method '{display_method}'", display_method=display.get('name'))
+            return False
+        sleep(VERIFY_POLL)
+
+
+def run_task_command(command):
+    ''' Run a custom command, returns whether it succeeded '''
+    import shlex
+    import subprocess
+    try:
+        return subprocess.call(shlex.split(command)) == 0
+    except OSError as exc:
+        log_error(msg="Exception running '{command}': {exc}", command=command, exc=exc)
+        return False
+
+
+def run_tasks(tasks):
+    ''' Run tasks concurrently, returns their outcome and duration once all finished or their deadline passed '''
+    import threading
+    from time import time
+    results = {}
+
+    def run_task(task):
+        ''' Run a single task and record its outcome '''
+        begin = time()
+        try:
+            outcome = 'failed' if task.get('function')(*task.get('args', [])) is False else 'ok'
+        except Exception as exc:  # pylint: disable=broad-except
+            log_error(msg="Exception in task '{name}': {exc}", name=task.get('name'), exc=exc)
+            outcome = 'failed'
+        results[task.get('name')] = (outcome, time() - begin)
+
+    start = time()
+    threads = []
+    for task in tasks:
+        thread = threading.Thread(target=run_task, args=(task,), name=task.get('name'))
+        thread.daemon = True
+        thread.start()
+        threads.append((task, thread))
+    for task, thread in threads:
+        # NOTE: A task that misses its deadline is left running in the background
+        thread.join(max(0, start + task.get('timeout') - time()))
+        if task.get('name') not in results:
+            results[task.get('name')] = ('timeout', time() - start)
+        outcome, duration = results.get(task.get('name'))
+        log(2 if outcome == 'ok' else 1, msg="Task '{name}' {outcome} after {duration:.3f}s", name=task.get('name'), outcome=outcome, duration=duration)
+    log(1, msg='Finished {count} tasks in {duration:.3f}s', count=len(tasks), duration=time() - start)
+    return results
+
+
+RTC_ROOT = os.environ.get('TURNOFF_RTC_ROOT', '/sys/class/rtc')
+VERIFY_POLL = 0.1
@@ -0,0 +1,745 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v2.0 (see COPYING or https://www.gnu.org/licenses/gpl-2.0.txt)
+''' The TurnOff screensaver, turning off display devices when Kodi goes into screensaver-mode '''
+
+from __future__ import absolute_import, division, unicode_literals
+import os
+# import atexit
+
+try:
+    from xbmc import Monitor
+    from xbmcgui import WindowDialog, WindowXMLDialog
+except ImportError:  # NOTE: Running outside of Kodi, only the command-line interface is available
+    class Monitor(object):
+        ''' Kodi monitors are unavailable outside of Kodi '''
+
+    class WindowDialog(object):
+        ''' Kodi windows are unavailable outside of Kodi '''
+
+    class WindowXMLDialog(object):
+        ''' Kodi windows are unavailable outside of Kodi '''
+
+from kodiutils import ADDON, ADDON_PROFILE, PROFILER, TRACE, TraceRecorder, atomic_write, func, jsonrpc, log, log_error, to_unicode
+from tasks import next_wake_time, run_task_command, run_tasks, set_wakealarm, stop_players, sync_filesystems, verify_display_off
+
+# NOTE: The below order relates to resources/settings.xml
+DISPLAY_METHODS = [
+    dict(name='do-nothing', title='Do nothing',
+         function='log',
+         args_off=[1, 'Do nothing to power off display'],
+         args_on=[1, 'Do nothing to power back on display']),
+    dict(name='cec-builtin', title='CEC (buil-in)',
+         function='run_builtin',
+         args_off=['CECStandby'],
+         args_on=['CECActivateSource']),
+    dict(name='no-signal-rpi', title='No Signal on Raspberry Pi (using vcgencmd)',
+         function='run_command',
+         args_off=['vcgencmd', 'display_power', '0'],
+         args_on=['vcgencmd', 'display_power', '1'],
+         verify=['vcgencmd', 'display_power'],
+         verify_off='display_power=0'),
+    dict(name='dpms-builtin', title='DPMS (built-in)',
+         function='run_builtin',
+         args_off=['ToggleDPMS'],
+         args_on=['ToggleDPMS']),
+    dict(name='dpms-xset', title='DPMS (using xset)',
+         function='run_command',
+         args_off=['xset', 'dpms', 'force', 'off'],
+         args_on=['xset', 'dpms', 'force', 'on'],
+         verify=['xset', 'q'],
+         verify_off='Monitor is Off'),
+    dict(name='dpms-vbetool', title='DPMS (using vbetool)',
+         function='run_command',
+         args_off=['vbetool', 'dpms', 'off'],
+         args_on=['vbetool', 'dpms', 'on']),
+    # TODO: This needs more outside testing
+    dict(name='dpms-xrandr', title='DPMS (using xrandr)',
+         function='run_command',
+         args_off=['xrandr', '--output CRT-0', 'off'],
+         args_on=['xrandr', '--output CRT-0', 'on']),
+    # TODO: This needs more outside testing
+    dict(name='cec-android', title='CEC on Android (kernel)',
+         function='run_command',
+         args_off=['su', '-c', 'echo 0 >/sys/devices/virtual/graphics/fb0/cec'],
+         args_on=['su', '-c', 'echo 1 >/sys/devices/virtual/graphics/fb0/cec']),
+    # NOTE: Contrary to what one might think, 1 means off and 0 means on
+    dict(name='backlight-rpi', title='Backlight on Raspberry Pi (kernel)',
+         function='run_command',
+         args_off=['su', '-c', 'echo 1 >/sys/class/backlight/rpi_backlight/bl_power'],
+         args_on=['su', '-c', 'echo 0 >/sys/class/backlight/rpi_backlight/bl_power']),
+    # NOTE: Fails to come back on RPIv3
+    dict(name='tvservice-rpi', title='HDMI on Raspberry Pi (tvservice)',
+         function='run_command',
+         args_off=['tvservice', '-o'],
+         args_on=['tvservice', '-p']),
+]
+
+POWER_METHODS = [
+    dict(name='do-nothing', title='Do nothing',
+         function='log', args=[1, 'Do nothing to power off system']),
+    dict(name='suspend-builtin', title='Suspend (built-in)',
+         function='jsonrpc', kwargs_off=dict(method='System.Suspend')),
+    dict(name='hibernate-builtin', title='Hibernate (built-in)',
+         function='jsonrpc', kwargs_off=dict(method='System.Hibernate')),
+    dict(name='quit-builtin', title='Quit (built-in)',
+         function='jsonrpc', kwargs_off=dict(method='Application.Quit')),
+    dict(name='shutdown-builtin', title='ShutDown action (built-in)',
+         function='jsonrpc', kwargs_off=dict(method='System.Shutdown')),
+    dict(name='reboot-builtin', title='Reboot (built-in)',
+         function='jsonrpc', kwargs_off=dict(method='System.Reboot')),
+    dict(name='powerdown-builtin', title='Powerdown (built-in)',
+         function='jsonrpc', kwargs_off=dict(method='System.Powerdown')),
+]
+
+# NOTE: These power methods can be woken up from using the RTC
+WAKE_POWER_METHODS = ('suspend-builtin', 'hibernate-builtin')
+
+# NOTE: These flags are stored in the state journal, do not renumber
+STATE_DISPLAY_OFF = 1
+STATE_MUTED = 2
+STATE_LOGGED_OFF = 4
+
+
+def set_mute(toggle=True):
+    ''' Set mute using Kodi JSON-RPC interface '''
+    toggle = bool(toggle)
+    result = jsonrpc(method='Application.SetMute', params=dict(mute=toggle))
+#    if '"result":'+toggle not in result:
+#        log_error(msg="Error in JSON-RPC: '{payload}' returns '{result}'", payload=payload, result=result)
+#        popup(msg="Error in JSON-RPC Application.SetMute: '%s'" % result)
+    return result
+
+
+class MuteState(object):
+    ''' Track whether Kodi is muted, so audio is only muted or unmuted when it has to change '''
+
+    def __init__(self):
+        ''' Initialize mute state, it is only queried when first needed '''
+        self.muted = None
+
+    def get(self):
+        ''' Return whether Kodi is muted, querying it once '''
+        if self.muted is None:
+            result = jsonrpc(method='Application.GetProperties', params=dict(properties=['muted']))
+            self.muted = result.get('result', {}).get('muted')
+        return self.muted
+
+    def update(self, data):
+        ''' Update the mute state from an Application.OnVolumeChanged notification '''
+        from json import loads
+        try:
+            muted = loads(data).get('muted')
+        except (AttributeError, ValueError):
+            return
+        if isinstance(muted, bool):
+            self.muted = muted
+
+    def set(self, muted):
+        ''' Mute or unmute audio, returns whether the state changed '''
+        if self.get() is muted:
+            return False
+        set_mute(muted)
+        self.muted = muted
+        return True
+
+
+def activate_window(window='home'):
+    ''' Set mute using Kodi JSON-RPC interface '''
+#    result = jsonrpc(method='GUI.ActivateWindow', params=dict(window=window, parameters=['Home']))
+    result = jsonrpc(method='GUI.ActivateWindow', params=dict(window=window, parameters=[]))
+#    if '"result":"OK"' not in result:
+#        log_error(msg="Error in JSON-RPC: '{payload}' returns '{result}'", payload=payload, result=result)
+#        popup(msg="Error in JSON-RPC GUI.ActivateWindow: '%s'" % result)
+    return result
+
+
+class StateJournal(object):
+    ''' A tiny fixed-size journal of the state applied by the screensaver '''
+
+    # Magic, version, display method, state flags, padding, timestamp
+    FORMAT = str('<4sBbBxd')
+    MAGIC = b'TOFF'
+    VERSION = 1
+
+    def __init__(self, path):
+        ''' Initialize journal '''
+        self.path = path
+        self.display = -1
+        self.state = 0
+        self.timestamp = 0.0
+
+    def load(self):
+        ''' Read the journal from disk, returns False when missing or invalid '''
+        from struct import calcsize, error, unpack
+        try:
+            with open(self.path, 'rb') as fdesc:
+                data = fdesc.read(calcsize(self.FORMAT) + 1)
+        except (IOError, OSError):
+            return False
+        try:
+            magic, version, display, state, timestamp = unpack(self.FORMAT, data)
+        except error:
+            log_error(msg="State journal '{path}' is corrupt, ignoring it", path=self.path)
+            return False
+        if magic != self.MAGIC or version != self.VERSION or not -1 <= display < len(DISPLAY_METHODS) or (state & STATE_DISPLAY_OFF and display < 0):
+            log_error(msg="State journal '{path}' is invalid, ignoring it", path=self.path)
+            return False
+        self.display, self.state, self.timestamp = display, state, timestamp
+        return True
+
+    def record(self, flag, display=None):
+        ''' Write-ahead a state change before it is applied '''
+        from time import time
+        from struct import pack
+        if display is not None:
+            self.display = display
+        self.state |= flag
+        self.timestamp = time()
+        atomic_write(self.path, pack(self.FORMAT, self.MAGIC, self.VERSION, self.display, self.state, self.timestamp))
+
+    def clear(self):
+        ''' Forget the recorded state once it has been reverted '''
+        self.display = -1
+        self.state = 0
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ActivationLock(object):
+    ''' An inter-process lock so only one activation at a time turns things off and on '''
+
+    def __init__(self, path):
+        ''' Initialize lock '''
+        self.path = path
+        self.handoff_path = path + '.handoff'
+        self.fdesc = None
+        self.owned = False
+        self.waited = False
+
+    def acquire(self, timeout=None):
+        ''' Acquire the lock, asking the current owner to hand off, returns False when taking over after a timeout '''
+        from time import sleep, time
+        try:
+            import fcntl
+        except ImportError:  # NOTE: No inter-process locking on Windows
+            return True
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        self.fdesc = open(self.path, 'a+')
+        deadline = time() + (LOCK_TIMEOUT if timeout is None else timeout)
+        self.waited = False
+        while True:
+            try:
+                fcntl.flock(self.fdesc.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except (IOError, OSError):
+                if not self.waited:
+                    log(2, msg='Another activation is in progress, requesting handoff')
+                    atomic_write(self.handoff_path, str(os.getpid()).encode())
+                    self.waited = True
+                if time() >= deadline:
+                    log_error(msg="Activation lock '{path}' is still held, taking over", path=self.path)
+                    self.fdesc.close()
+                    self.fdesc = None
+                    return False
+                sleep(LOCK_POLL)
+
+        # NOTE: An owner that released the lock cleanly leaves it empty
+        self.fdesc.seek(0)
+        owner = self.fdesc.read().strip()
+        if owner:
+            log(2, msg="Recovered stale activation lock of '{owner}'", owner=owner)
+        self.fdesc.seek(0)
+        self.fdesc.truncate()
+        self.fdesc.write('{pid} {time}'.format(pid=os.getpid(), time=time()))
+        self.fdesc.flush()
+        if os.path.exists(self.handoff_path):
+            os.remove(self.handoff_path)
+        self.owned = True
+        return True
+
+    def handoff_requested(self):
+        ''' Whether a new activation is waiting to take over '''
+        return self.owned and os.path.exists(self.handoff_path)
+
+    def release(self):
+        ''' Release the lock '''
+        if not self.fdesc:
+            return
+        import fcntl
+        if self.owned:
+            self.fdesc.seek(0)
+            self.fdesc.truncate()
+            self.fdesc.flush()
+            fcntl.flock(self.fdesc.fileno(), fcntl.LOCK_UN)
+        self.fdesc.close()
+        self.fdesc = None
+        self.owned = False
+
+
+class Telemetry(object):
+    ''' Counters of activation cycles per method, kept with the most recent cycles in a compact ring buffer '''
+
+    # Magic, version, number of display methods, number of power methods, cycles, resumes
+    HEADER = str('<4sBBBxII')
+    # Activations, failures, seconds with the display off or the system powered off
+    TOTALS = str('<IId')
+    # Start timestamp, display method, power method, flags, padding, display off seconds, powered off seconds
+    RECORD = str('<dbbBxff')
+    MAGIC = b'TOFM'
+    VERSION = 1
+    FAILED_DISPLAY = 1
+    FAILED_POWER = 2
+    RESUMED = 4
+
+    def __init__(self, path, textfile=None):
+        ''' Initialize telemetry '''
+        self.path = path
+        self.textfile = textfile
+        self.cycles = 0
+        self.resumes = 0
+        self.display = [[0, 0, 0.0] for _ in DISPLAY_METHODS]
+        self.power = [[0, 0, 0.0] for _ in POWER_METHODS]
+        self.ring = []
+
+    def load(self):
+        ''' Read the counters and recent cycles from disk, returns False when missing or invalid '''
+        from struct import calcsize, error, unpack_from
+        try:
+            with open(self.path, 'rb') as fdesc:
+                data = fdesc.read()
+        except (IOError, OSError):
+            return False
+        try:
+            magic, version, displays, powers, cycles, resumes = unpack_from(self.HEADER, data)
+            offset = calcsize(self.HEADER)
+            totals = [list(unpack_from(self.TOTALS, data, offset + index * calcsize(self.TOTALS))) for index in range(displays + powers)]
+            offset += len(totals) * calcsize(self.TOTALS)
+            ring = [list(unpack_from(self.RECORD, data, offset + index * calcsize(self.RECORD))) for index in range(min(cycles, TELEMETRY_RING))]
+        except error:
+            log_error(msg="Telemetry '{path}' is corrupt, ignoring it", path=self.path)
+            return False
+        if magic != self.MAGIC or version != self.VERSION:
+            log_error(msg="Telemetry '{path}' is invalid, ignoring it", path=self.path)
+            return False
+        # NOTE: Methods are only ever added to the end of the method tables
+        self.display[:displays] = totals[:min(displays, len(DISPLAY_METHODS))]
+        self.power[:powers] = totals[displays:displays + min(powers, len(POWER_METHODS))]
+        self.cycles, self.resumes, self.ring = cycles, resumes, ring
+        return True
+
+    def save(self, force=False):
+        ''' Write the counters and recent cycles to disk, and export them '''
+        from struct import pack
+        data = pack(self.HEADER, self.MAGIC, self.VERSION, len(self.display), len(self.power), self.cycles, self.resumes)
+        data += b''.join(pack(self.TOTALS, *total) for total in self.display + self.power)
+        data += b''.join(pack(self.RECORD, *record) for record in self.ring)
+        atomic_write(self.path, data)
+        self.export(force)
+
+    def activated(self, display, power, start):
+        ''' Count the start of an activation cycle '''
+        record = [start, display, power, 0, 0.0, 0.0]
+        slot = self.cycles % TELEMETRY_RING
+        if slot < len(self.ring):
+            self.ring[slot] = record
+        else:
+            self.ring.append(record)
+        self.cycles += 1
+        self.display[display][0] += 1
+        self.power[power][0] += 1
+
+    def failed(self, kind, index):
+        ''' Count a failing display or power method '''
+        (self.display if kind == 'display' else self.power)[index][1] += 1
+        if self.ring:
+            self.ring[(self.cycles - 1) % TELEMETRY_RING][3] |= self.FAILED_DISPLAY if kind == 'display' else self.FAILED_POWER
+
+    def resumed(self, display_off, powered_off):
+        ''' Count the end of an activation cycle, with the seconds the display and the system were off '''
+        self.resumes += 1
+        if not self.ring:
+            return
+        record = self.ring[(self.cycles - 1) % TELEMETRY_RING]
+        record[3] |= self.RESUMED
+        record[4], record[5] = display_off, powered_off
+        self.display[record[1]][2] += display_off
+        self.power[record[2]][2] += powered_off
+
+    def export(self, force=False):
+        ''' Write the counters as a node_exporter textfile, at most once every TELEMETRY_INTERVAL seconds '''
+        from time import time
+        if not self.textfile:
+            return False
+        if not force and os.path.exists(self.textfile) and time() - os.path.getmtime(self.textfile) < TELEMETRY_INTERVAL:
+            return False
+        lines = []
+        for metric, kind, description, methods, totals, field in (
+                ('turnoff_display_activations_total', 'counter', 'Activations per display method', DISPLAY_METHODS, self.display, 0),
+                ('turnoff_display_failures_total', 'counter', 'Failures per display method', DISPLAY_METHODS, self.display, 1),
+                ('turnoff_display_off_seconds_total', 'counter', 'Seconds with the display off per display method', DISPLAY_METHODS, self.display, 2),
+                ('turnoff_power_activations_total', 'counter', 'Activations per power method', POWER_METHODS, self.power, 0),
+                ('turnoff_power_failures_total', 'counter', 'Failures per power method', POWER_METHODS, self.power, 1),
+                ('turnoff_suspended_seconds_total', 'counter', 'Seconds suspended or powered off per power method', POWER_METHODS, self.power, 2)):
+            lines.append('# HELP {metric} {description}'.format(metric=metric, description=description))
+            lines.append('# TYPE {metric} {kind}'.format(metric=metric, kind=kind))
+            for method, total in zip(methods, totals):
+                lines.append('{metric}{{method="{method}"}} {value}'.format(metric=metric, method=method.get('name'), value=total[field]))
+        last = self.ring[(self.cycles - 1) % TELEMETRY_RING] if self.ring else [0] * 6
+        for metric, kind, description, value in (
+                ('turnoff_resumes_total', 'counter', 'Resumed activations', self.resumes),
+                ('turnoff_active', 'gauge', 'Whether the screensaver is active', int(bool(self.ring) and not last[3] & self.RESUMED)),
+                ('turnoff_last_activation_timestamp_seconds', 'gauge', 'Start of the last activation', last[0]),
+                ('turnoff_last_display_off_seconds', 'gauge', 'Seconds with the display off during the last resumed activation', last[4])):
+            lines.append('# HELP {metric} {description}'.format(metric=metric, description=description))
+            lines.append('# TYPE {metric} {kind}'.format(metric=metric, kind=kind))
+            lines.append('{metric} {value}'.format(metric=metric, value=value))
+        atomic_write(self.textfile, ('\n'.join(lines) + '\n').encode('utf-8'))
+        return True
+
+
+def recover(startup=False):
+    ''' Revert the state left behind by a screensaver that never resumed, at Kodi startup toggle methods are left alone '''
+    journal = StateJournal(JOURNAL_PATH)
+    if not journal.load() or not journal.state:
+        return False
+
+    log(1, msg='Recovering from interrupted screensaver, state={state}', state=journal.state)
+    # Unmute audio
+    if journal.state & STATE_MUTED:
+        log(1, msg='Unmute audio')
+        set_mute(False)
+
+    # Turn on display
+    if journal.state & STATE_DISPLAY_OFF:
+        display = DISPLAY_METHODS[journal.display]
+        # NOTE: A freshly started Kodi has the display on, so toggling it would turn it off
+        if startup and display.get('args_off') == display.get('args_on'):
+            log(1, msg="Display signal is on after restart, not toggling method '{display_method}'", display_method=display.get('name'))
+        else:
+            log(1, msg="Turn display signal back on using method '{display_method}'", display_method=display.get('name'))
+            func(display.get('function'), *display.get('args_on'))
+
+    # NOTE: A logged off user has to log back in, there is nothing to revert
+    if journal.state & STATE_LOGGED_OFF:
+        log(2, msg='User was logged off by interrupted screensaver')
+
+    journal.clear()
+    return True
+
+
+class TurnOffMonitor(Monitor, object):
+    ''' This is the monitor to exit TurnOffScreensaver '''
+
+    def __init__(self, **kwargs):
+        ''' Initialize monitor '''
+        self.action = kwargs.get('action')
+        self.volume_changed = kwargs.get('volume_changed')
+        self.wake = kwargs.get('wake')
+        super(TurnOffMonitor, self).__init__()
+
+    def onNotification(self, sender, method, data):  # pylint: disable=invalid-name,unused-argument
+        ''' Handle Kodi notifications '''
+        if method == 'System.OnWake' and self.wake:
+            TRACE.event('wake')
+            self.wake()
+        elif method == 'Application.OnVolumeChanged' and self.volume_changed:
+            self.volume_changed(data)
+
+    def onScreensaverDeactivated(self):  # pylint: disable=invalid-name
+        ''' Perform cleanup function '''
+        TRACE.event('deactivated')
+        self.action()
+
+
+class ActivationCycle(object):
+    ''' The methods used by one activation cycle, and when it turned things off and on again '''
+
+    def __init__(self, display, power):
+        ''' Initialize activation cycle '''
+        self.display = display
+        self.power = power
+        self.display_off_time = None
+        self.power_off_time = None
+        self.power_on_time = None
+        self.wake_time = None
+        self.wake_timer = None
+
+
+class TurnOffScreensaver(object):
+    ''' The TurnOffScreensaver logic shared by its windows '''
+
+    def __init__(self, *args):
+        ''' Initialize screensaver '''
+        self.cycle = None
+        self.journal = StateJournal(JOURNAL_PATH)
+        self.lock = ActivationLock(LOCK_PATH)
+        self.monitor = None
+        self.mute_state = MuteState()
+        self.resumed = False
+        self.telemetry = Telemetry(TELEMETRY_PATH)
+        super(TurnOffScreensaver, self).__init__(*args)
+
+    def activate(self):
+        ''' Perform this when the screensaver is started '''
+        if PROFILER.enabled():
+            PROFILER.start()
+
+        display_method = int(ADDON.getSetting('display_method'))
+        power_method = int(ADDON.getSetting('power_method'))
+
+        self.cycle = ActivationCycle(DISPLAY_METHODS[display_method], POWER_METHODS[power_method])
+        logoff = to_unicode(ADDON.getSetting('logoff'))
+        mute = to_unicode(ADDON.getSetting('mute'))
+
+        if TraceRecorder.enabled():
+            TRACE.start(display=self.cycle.display.get('name'), power=self.cycle.power.get('name'), logoff=logoff, mute=mute)
+            TRACE.event('activate')
+
+        log(2, msg='display_method={display_method}, power_method={power_method}, logoff={logoff}, mute={mute}',
+            display_method=self.cycle.display.get('name'), power_method=self.cycle.power.get('name'),
+            logoff=logoff, mute=mute)
+
+        if ADDON.getSetting('telemetry') == 'true':
+            self.telemetry.textfile = os.path.join(to_unicode(ADDON.getSetting('textfile_dir')) or ADDON_PROFILE, TELEMETRY_TEXTFILE)
+
+        self.lock.acquire()
+        try:
+            self.turn_off(display_method, logoff, mute)
+        except BaseException:
+            # NOTE: The journal keeps what was applied, so the next activation or recovery can adopt it
+            if self.cycle.display_off_time:
+                self.telemetry.save()
+            self.lock.release()
+            raise
+
+    def adopt(self):
+        ''' Return the state applied by the activation we waited for, revert the state of an interrupted one '''
+        if not self.journal.load() or not self.journal.state:
+            return 0
+        # NOTE: Only an activation we waited for is still in progress, anything else was interrupted
+        if self.lock.waited:
+            log(1, msg='Adopting state of previous activation, state={state}', state=self.journal.state)
+            return self.journal.state
+        try:
+            recover()
+        except SystemExit:
+            log_error(msg='Unable to revert the state of an interrupted screensaver')
+        self.journal.clear()
+        return 0
+
+    def turn_off(self, display_method, logoff, mute):
+        ''' Turn off everything, adopting what a previous activation already turned off '''
+        from time import time
+        adopted = self.adopt()
+
+        # Turn off display
+        display_off = adopted & STATE_DISPLAY_OFF and self.journal.display == display_method
+        if display_off:
+            log(1, msg="Display signal already off using method '{display_method}'", display_method=self.cycle.display.get('name'))
+        elif self.cycle.display.get('name') != 'do-nothing':
+            log(1, msg="Turn display signal off using method '{display_method}'", display_method=self.cycle.display.get('name'))
+            self.journal.record(STATE_DISPLAY_OFF, display=display_method)
+        succeeded = False
+        self.cycle.display_off_time = time()
+        try:
+            succeeded = display_off or self.run_method('display', *self.cycle.display.get('args_off'))
+        finally:
+            # NOTE: Only counted once the display is off, so no disk I/O delays turning it off
+            self.telemetry.load()
+            self.telemetry.activated(display_method, POWER_METHODS.index(self.cycle.power), self.cycle.display_off_time)
+            if not succeeded:
+                self.count_failure('display')
+
+        # FIXME: Screensaver always seems to lock when started, requires unlock and re-login
+        # Log off user
+        if logoff == 'true' and not adopted & STATE_LOGGED_OFF:
+            log(1, msg='Log off user')
+            self.journal.record(STATE_LOGGED_OFF)
+            activate_window('loginscreen')
+#            run_builtin('System.LogOff')
+#            run_builtin('ActivateWindow(loginscreen)')
+#            run_builtin('ActivateWindowAndFocus(loginscreen,return)')
+
+        # Mute audio
+        # NOTE: Audio that was already muted is left alone, and stays muted on resume
+        if mute == 'true' and not adopted & STATE_MUTED:
+            if self.mute_state.get():
+                log(1, msg='Audio is already muted')
+            else:
+                log(1, msg='Mute audio')
+                self.journal.record(STATE_MUTED)
+                self.mute_state.set(True)
+            # NOTE: Since the Mute-builtin is a toggle, we need to do this to ensure Mute
+#            run_builtin('VolumeDown')
+#            run_builtin('Mute')
+
+        self.monitor = TurnOffMonitor(action=self.resume, volume_changed=self.mute_state.update, wake=self.warm_up)
+
+        # Schedule waking up ahead of time
+        if self.cycle.power.get('name') in WAKE_POWER_METHODS and ADDON.getSetting('wake') == 'true':
+            try:
+                wake_lead = int(ADDON.getSetting('wake_lead') or 0) * 60
+                self.cycle.wake_time = next_wake_time(to_unicode(ADDON.getSetting('wake_time')), lead=wake_lead)
+            except ValueError as exc:
+                log_error(msg="Invalid wake up time '{wake_time}' or lead '{wake_lead}', not scheduling wake up: {exc}",
+                          wake_time=ADDON.getSetting('wake_time'), wake_lead=ADDON.getSetting('wake_lead'), exc=exc)
+
+        # NOTE: Written before powering off, so the pending writes are flushed with the other tasks
+        self.telemetry.save()
+
+        # Power off system
+        if self.cycle.power.get('name') != 'do-nothing':
+            run_tasks(self.power_off_tasks())
+            log(1, msg="Turn system off using method '{power_method}'", power_method=self.cycle.power.get('name'))
+            self.cycle.power_off_time = time()
+        if not self.run_method('power', **self.cycle.power.get('kwargs_off', {})):
+            self.count_failure('power')
+
+    def run_method(self, kind, *args, **kwargs):
+        ''' Run the display or power method, returns whether it succeeded '''
+        result = func(getattr(self.cycle, kind).get('function'), *args, **kwargs)
+        return result is not False and not (isinstance(result, dict) and result.get('error'))
+
+    def count_failure(self, kind):
+        ''' Count a failing display or power method '''
+        self.telemetry.failed(kind, (DISPLAY_METHODS if kind == 'display' else POWER_METHODS).index(getattr(self.cycle, kind)))
+
+    def power_off_tasks(self):
+        ''' The tasks to finish before powering off the system '''
+        timeout = float(ADDON.getSetting('tasks_timeout') or TASKS_TIMEOUT)
+        tasks = []
+        if ADDON.getSetting('stop_players') != 'false':
+            tasks.append(dict(name='stop-players', function=stop_players, timeout=timeout))
+        if ADDON.getSetting('sync') != 'false':
+            tasks.append(dict(name='sync', function=sync_filesystems, timeout=timeout))
+        if ADDON.getSetting('verify_display') != 'false' and self.cycle.display.get('verify'):
+            tasks.append(dict(name='verify-display-off', function=verify_display_off, args=[self.cycle.display, timeout], timeout=timeout))
+        if self.cycle.wake_time:
+            wake_lead = int(ADDON.getSetting('wake_lead') or 0) * 60
+            tasks.append(dict(name='wakealarm', function=set_wakealarm, args=[self.cycle.wake_time - wake_lead], timeout=timeout))
+        for command in to_unicode(ADDON.getSetting('commands')).split(';'):
+            if command.strip():
+                tasks.append(dict(name=command.strip(), function=run_task_command, args=[command.strip()], timeout=timeout))
+        return tasks
+
+    def warm_up(self):
+        ''' Re-establish the backends after a scheduled wake up, keep the display off until the wake time '''
+        from threading import Timer
+        from time import time
+        if self.resumed:
+            return
+        self.cycle.power_on_time = self.cycle.power_on_time or time()
+        if not self.cycle.wake_time:
+            return
+        log(1, msg='Warming up after scheduled wake up')
+        jsonrpc(method='JSONRPC.Ping')
+
+        # NOTE: Waking up may turn the display back on, unless the method is a toggle
+        if self.cycle.display.get('args_off') != self.cycle.display.get('args_on'):
+            func(self.cycle.display.get('function'), *self.cycle.display.get('args_off'))
+
+        delay = self.cycle.wake_time - time()
+        self.cycle.wake_time = None
+        if delay <= 0:
+            self.resume()
+            return
+        log(1, msg='Turning display back on in {delay} seconds', delay=int(delay))
+        self.cycle.wake_timer = Timer(delay, self.resume)
+        self.cycle.wake_timer.daemon = True
+        self.cycle.wake_timer.start()
+
+    def resume(self):
+        ''' Perform this when the Screensaver is stopped '''
+        from time import time
+        # NOTE: Either the user or the scheduled wake time may resume first
+        if self.resumed:
+            return
+        if self.cycle.wake_timer:
+            self.cycle.wake_timer.cancel()
+
+        try:
+            # NOTE: A new activation waiting for the lock adopts our state, so there is nothing to restore
+            if self.lock.handoff_requested():
+                log(1, msg='Handing off to the next activation')
+            else:
+                self.turn_on()
+        finally:
+            # NOTE: Even when turning back on fails, the next activation must not wait for the lock
+            now = time()
+            powered_off = (self.cycle.power_on_time or now) - self.cycle.power_off_time if self.cycle.power_off_time else 0.0
+            self.telemetry.resumed(now - (self.cycle.display_off_time or now), powered_off)
+            self.telemetry.save(force=True)
+            self.lock.release()
+
+            PROFILER.stop()
+
+            TRACE.event('resume')
+            TRACE.stop()
+
+            # Clean up everything
+            self.resumed = True
+            self.cleanup()
+
+    def turn_on(self):
+        ''' Turn everything back on '''
+        # Unmute audio
+        if self.journal.state & STATE_MUTED:
+            if self.mute_state.set(False):
+                log(1, msg='Unmute audio')
+            else:
+                log(1, msg='Audio was already unmuted')
+#            run_builtin('Mute')
+            # NOTE: Since the Mute-builtin is a toggle, we need to do this to ensure Unmute
+#            run_builtin('VolumeUp')
+
+        # Turn on display
+        if self.cycle.display.get('name') != 'do-nothing':
+            log(1, msg="Turn display signal back on using method '{display_method}'", display_method=self.cycle.display.get('name'))
+        try:
+            succeeded = self.run_method('display', *self.cycle.display.get('args_on'))
+        except SystemExit:
+            self.count_failure('display')
+            raise
+        if not succeeded:
+            self.count_failure('display')
+        self.journal.clear()
+
+#    @atexit.register
+    def cleanup(self):
+        ''' Clean up function '''
+        if hasattr(self, 'monitor'):
+            del self.monitor
+
+        self.close()  # pylint: disable=no-member
+        del self
+
+
+class TurnOffDialog(TurnOffScreensaver, WindowXMLDialog):
+    ''' The TurnOffScreensaver class managing the XML gui '''
+
+    def onInit(self):  # pylint: disable=invalid-name
+        ''' Perform this when the screensaver window is shown '''
+        self.activate()
+
+
+class TurnOffWindow(TurnOffScreensaver, WindowDialog):
+    ''' The TurnOffScreensaver class using a code-built window, without skin XML to load '''
+
+    def run(self):
+        ''' Turn off before the window is shown, then wait for the screensaver to be deactivated '''
+        self.activate()
+        if not self.resumed:
+            self.doModal()
+
+
+JOURNAL_PATH = os.path.join(ADDON_PROFILE, 'journal.bin')
+LOCK_PATH = os.path.join(ADDON_PROFILE, 'activation.lock')
+LOCK_POLL = 0.05
+LOCK_TIMEOUT = 5
+TASKS_TIMEOUT = 5
+TELEMETRY_INTERVAL = 60
+TELEMETRY_PATH = os.path.join(ADDON_PROFILE, 'telemetry.bin')
+TELEMETRY_RING = 64
+TELEMETRY_TEXTFILE = 'screensaver_turnoff.prom'
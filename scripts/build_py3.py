@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v2.0 (see COPYING or https://www.gnu.org/licenses/gpl-2.0.txt)
+''' Build a Python 3 only package, without Python 2 shims and with precompiled bytecode '''
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import compileall
+import os
+import py_compile
+import re
+import shutil
+import sys
+import tempfile
+import zipfile
+
+# NOTE: Kodi 19 (Matrix) is the first release running Python 3
+PY3_XBMC_PYTHON = '3.0.0'
+
+
+def strip_py2(source):
+    ''' Remove Python 2 shims: __future__ imports and BEGIN PY2/END PY2 blocks '''
+    lines = []
+    skipping = False
+    for line in source.splitlines(True):
+        if line.startswith('# BEGIN PY2'):
+            skipping = True
+        elif line.startswith('# END PY2'):
+            skipping = False
+        elif not skipping and not line.startswith('from __future__ import '):
+            lines.append(line)
+    if skipping:
+        raise ValueError('Unterminated BEGIN PY2 block')
+    return ''.join(lines)
+
+
+def build(output, paths, basedir='.'):
+    ''' Copy paths into a staging directory, strip shims, precompile and zip it up '''
+    with open(os.path.join(basedir, 'addon.xml')) as fdesc:
+        addon_xml = fdesc.read()
+    addon_id = re.search(r'<addon id="([^"]+)"', addon_xml).group(1)
+    staging = tempfile.mkdtemp()
+    target = os.path.join(staging, addon_id)
+    try:
+        for path in paths:
+            source = os.path.join(basedir, path)
+            if not os.path.exists(source):
+                print('Skipping missing file: %s' % path, file=sys.stderr)
+            elif os.path.isdir(source):
+                shutil.copytree(source, os.path.join(target, path), ignore=shutil.ignore_patterns('*.pyc', '*.pyo', '__pycache__'))
+            else:
+                if not os.path.isdir(os.path.dirname(os.path.join(target, path))):
+                    os.makedirs(os.path.dirname(os.path.join(target, path)))
+                shutil.copy2(source, os.path.join(target, path))
+
+        with open(os.path.join(target, 'addon.xml'), 'w') as fdesc:
+            fdesc.write(re.sub(r'(<import addon="xbmc.python" version=")[^"]+(")', r'\g<1>%s\g<2>' % PY3_XBMC_PYTHON, addon_xml))
+
+        for root, _, files in os.walk(target):
+            for name in files:
+                if not name.endswith('.py'):
+                    continue
+                path = os.path.join(root, name)
+                with open(path) as fdesc:
+                    source = fdesc.read()
+                with open(path, 'w') as fdesc:
+                    fdesc.write(strip_py2(source))
+
+        # NOTE: Hash-based bytecode stays valid when the package is extracted with different mtimes
+        if not compileall.compile_dir(target, quiet=1, invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH):
+            raise SystemExit('Compilation failed')
+
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for root, _, files in os.walk(target):
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    archive.write(path, os.path.relpath(path, staging))
+    finally:
+        shutil.rmtree(staging)
+    print('Built %s for Python %d.%d' % (output, sys.version_info.major, sys.version_info.minor))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        raise SystemExit('Usage: %s OUTPUT.zip PATH...' % sys.argv[0])
+    build(sys.argv[1], sys.argv[2:])
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v2.0 (see COPYING or https://www.gnu.org/licenses/gpl-2.0.txt)
+''' This Kodi service reverts the display and audio state of a screensaver that never resumed '''
+
+from __future__ import absolute_import, division, unicode_literals
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'lib'))
+
+if __name__ == '__main__':
+    from turnoff import recover
+    recover(startup=True)
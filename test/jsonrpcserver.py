@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+''' A local stub of the Kodi JSON-RPC TCP server, answering using the xbmc stub '''
+
+# pylint: disable=invalid-name
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import threading
+import time
+from xbmc import executeJSONRPC
+
+try:  # Python 3
+    from socketserver import BaseRequestHandler, ThreadingTCPServer
+except ImportError:  # Python 2
+    from SocketServer import BaseRequestHandler, ThreadingTCPServer
+
+
+class JSONRPCHandler(BaseRequestHandler):
+    ''' Answer a stream of concatenated JSON-RPC requests, like Kodi does '''
+
+    def handle(self):
+        ''' Handle a single client connection '''
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        decoder = json.JSONDecoder()
+        buf = ''
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            buf += data.decode('utf-8')
+            while buf.strip():
+                buf = buf.lstrip()
+                try:
+                    command, end = decoder.raw_decode(buf)
+                except ValueError:
+                    break
+                buf = buf[end:]
+                with server.lock:
+                    server.requests.append(command)
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.hang:
+                    continue
+                self.request.sendall(executeJSONRPC(json.dumps(command)).encode('utf-8'))
+
+
+class JSONRPCServer(ThreadingTCPServer, object):
+    ''' A stub Kodi JSON-RPC TCP server listening on a random local port '''
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, latency=0, hang=False):
+        ''' Start serving in a background thread '''
+        super(JSONRPCServer, self).__init__(('127.0.0.1', 0), JSONRPCHandler)
+        self.latency = latency
+        self.hang = hang
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever, kwargs=dict(poll_interval=0.05))
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def port(self):
+        ''' The port the server is listening on '''
+        return self.server_address[1]
+
+    def methods(self):
+        ''' Return the methods of all requests received so far '''
+        with self.lock:
+            return [command.get('method') for command in self.requests]
+
+    def stop(self):
+        ''' Stop serving '''
+        self.shutdown()
+        self.server_close()
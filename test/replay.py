@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+''' Replay recorded activation traces through the Kodi stubs, so timing regressions reproduce offline '''
+
+# pylint: disable=invalid-name,unused-argument
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import xbmc
+import kodiutils
+import turnoff
+
+
+def load_trace(path):
+    ''' Read a trace file, returns its header and events '''
+    with open(path) as fdesc:
+        header = json.loads(fdesc.readline())
+        events = [json.loads(line) for line in fdesc if line.strip()]
+    return header, events
+
+
+class ReplayPopen(object):
+    ''' A subprocess.Popen replacement replaying the recorded latency and outcome of commands '''
+    COMMANDS = {}
+
+    def __init__(self, command, **kwargs):
+        ''' Start replaying a command '''
+        self.command = ' '.join(command)
+        self.latency, self.error = (self.COMMANDS.get(self.command) or [(0, None)]).pop(0)
+        self.returncode = None
+        # NOTE: A command that raised an exception exited with code 2
+        if self.error == 'exit 2':
+            time.sleep(self.latency)
+            raise OSError("Replayed failure of '%s'" % self.command)
+
+    def communicate(self):
+        ''' Wait for the recorded latency '''
+        time.sleep(self.latency)
+        self.returncode = 1 if self.error else 0
+        return (b'', b'')
+
+
+def replay(path):
+    ''' Feed a recorded trace through the stubs and return the trace recorded while replaying '''
+    header, events = load_trace(path)
+    display_names = [method.get('name') for method in turnoff.DISPLAY_METHODS]
+    power_names = [method.get('name') for method in turnoff.POWER_METHODS]
+    deactivated = None
+    for offset, kind, name, latency, error in events:
+        if kind in ('jsonrpc', 'run_builtin'):
+            xbmc.LATENCIES.setdefault(name, []).append(latency)
+        elif kind == 'run_command':
+            ReplayPopen.COMMANDS.setdefault(name, []).append((latency, error))
+        elif kind == 'event' and name == 'deactivated':
+            deactivated = offset
+
+    settings = dict(kodiutils.ADDON.settings)
+    kodiutils.ADDON.settings.update(
+        display_method=str(display_names.index(header.get('display'))),
+        power_method=str(power_names.index(header.get('power'))),
+        logoff=header.get('logoff'),
+        mute=header.get('mute'),
+    )
+    directory = tempfile.mkdtemp()
+    popen = subprocess.Popen
+    os.environ['TURNOFF_TRACE'] = '1'
+    kodiutils.TRACE.directory = directory
+    subprocess.Popen = ReplayPopen
+    try:
+        window = turnoff.TurnOffWindow()
+        try:
+            window.activate()
+        except SystemExit:
+            kodiutils.TRACE.stop()
+        else:
+            if deactivated is not None:
+                time.sleep(max(0, kodiutils.TRACE.start_time + deactivated - time.time()))
+                window.monitor.onScreensaverDeactivated()
+            else:
+                window.resume()
+        return load_trace(os.path.join(directory, os.listdir(directory)[0]))
+    finally:
+        subprocess.Popen = popen
+        kodiutils.TRACE.directory = None
+        del os.environ['TURNOFF_TRACE']
+        kodiutils.ADDON.settings.clear()
+        kodiutils.ADDON.settings.update(settings)
+        xbmc.LATENCIES.clear()
+        ReplayPopen.COMMANDS.clear()
+        shutil.rmtree(directory)
+
+
+def compare(recorded, replayed):
+    ''' Pair up recorded and replayed events, returns (kind, name, recorded offset, replayed offset, recorded latency, replayed latency) '''
+    return [(old[1], old[2], old[0], new[0], old[3], new[3]) for old, new in zip(recorded, replayed)]
+
+
+def main(argv=None):
+    ''' Replay trace files and print recorded versus replayed timings '''
+    for path in argv or sys.argv[1:]:
+        print(path)
+        for kind, name, old_offset, new_offset, old_latency, new_latency in compare(load_trace(path)[1], replay(path)[1]):
+            print('  {kind:<12} {name:<40} at {old_offset:8.3f}s/{new_offset:8.3f}s took {old_latency:8.3f}s/{new_latency:8.3f}s'.format(
+                kind=kind, name=name, old_offset=old_offset, new_offset=new_offset, old_latency=old_latency, new_latency=new_latency))
+
+
+if __name__ == '__main__':
+    main()
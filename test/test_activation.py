@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+# pylint: disable=invalid-name,missing-docstring
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import sys
+import threading
+import time
+import unittest
+import kodiutils
+import turnoff
+
+
+class TestActivation(unittest.TestCase):
+
+    def test_journal(self):
+        ''' Test writing and reading back the state journal '''
+        journal = turnoff.StateJournal(turnoff.JOURNAL_PATH)
+        journal.record(turnoff.STATE_DISPLAY_OFF, display=1)
+        journal.record(turnoff.STATE_MUTED)
+        loaded = turnoff.StateJournal(turnoff.JOURNAL_PATH)
+        self.assertTrue(loaded.load())
+        self.assertEqual(loaded.display, 1)
+        self.assertEqual(loaded.state, turnoff.STATE_DISPLAY_OFF | turnoff.STATE_MUTED)
+        journal.clear()
+        self.assertFalse(loaded.load())
+
+    def test_journal_corrupt(self):
+        ''' Test ignoring a truncated state journal '''
+        with open(turnoff.JOURNAL_PATH, 'wb') as fdesc:
+            fdesc.write(b'TOFF')
+        self.assertFalse(turnoff.StateJournal(turnoff.JOURNAL_PATH).load())
+        self.assertFalse(turnoff.recover())
+
+    def test_recover_toggle(self):
+        ''' Test leaving toggle methods alone when recovering at Kodi startup '''
+        commands = []
+        run_builtin = kodiutils.run_builtin
+        kodiutils.run_builtin = commands.append
+        try:
+            # The dpms-builtin method toggles the display
+            journal = turnoff.StateJournal(turnoff.JOURNAL_PATH)
+            journal.record(turnoff.STATE_DISPLAY_OFF, display=3)
+            self.assertTrue(turnoff.recover(startup=True))
+            self.assertEqual(commands, [])
+            self.assertFalse(journal.load())
+
+            # While Kodi keeps running, the display is still toggled off
+            journal.record(turnoff.STATE_DISPLAY_OFF, display=3)
+            self.assertTrue(turnoff.recover())
+            self.assertEqual(commands, ['ToggleDPMS'])
+        finally:
+            kodiutils.run_builtin = run_builtin
+
+    def test_recover(self):
+        ''' Test reverting the state of an interrupted screensaver '''
+        journal = turnoff.StateJournal(turnoff.JOURNAL_PATH)
+        journal.record(turnoff.STATE_DISPLAY_OFF | turnoff.STATE_MUTED | turnoff.STATE_LOGGED_OFF, display=1)
+        self.assertTrue(turnoff.recover())
+        self.assertFalse(journal.load())
+        self.assertFalse(turnoff.recover())
+
+    def test_activation_lock(self):
+        ''' Test recovering a stale lock and timing out on a held lock '''
+        with open(turnoff.LOCK_PATH, 'w') as fdesc:
+            fdesc.write('12345 0')
+        first = turnoff.ActivationLock(turnoff.LOCK_PATH)
+        self.assertTrue(first.acquire())
+        second = turnoff.ActivationLock(turnoff.LOCK_PATH)
+        self.assertFalse(second.acquire(timeout=0.1))
+        self.assertTrue(first.handoff_requested())
+        first.release()
+        self.assertTrue(second.acquire(timeout=0.1))
+        self.assertFalse(second.handoff_requested())
+        second.release()
+
+    def test_activation_lock_unsupported(self):
+        ''' Test activating without inter-process locking, like on Windows '''
+        fcntl = sys.modules.get('fcntl')
+        sys.modules['fcntl'] = None
+        try:
+            lock = turnoff.ActivationLock(turnoff.LOCK_PATH)
+            self.assertTrue(lock.acquire())
+            self.assertFalse(lock.handoff_requested())
+            lock.release()
+        finally:
+            if fcntl:
+                sys.modules['fcntl'] = fcntl
+            else:
+                del sys.modules['fcntl']
+
+    def test_activation_handoff(self):
+        ''' Test a new activation adopting the state of the previous one instead of repeating commands '''
+        kodiutils.ADDON.settings.update(display_method='1', power_method='0', logoff='false', mute='true')
+        commands = []
+        run_builtin, set_mute = kodiutils.run_builtin, turnoff.set_mute
+        kodiutils.run_builtin = commands.append
+        turnoff.set_mute = lambda muted: commands.append('mute' if muted else 'unmute') or set_mute(muted)
+        try:
+            first = turnoff.TurnOffWindow()
+            first.activate()
+            self.assertEqual(commands, ['CECStandby', 'mute'])
+            second = turnoff.TurnOffWindow()
+            thread = threading.Thread(target=second.activate)
+            thread.start()
+            while not os.path.exists(first.lock.handoff_path):
+                time.sleep(0.01)
+            first.resume()
+            thread.join()
+            self.assertEqual(commands, ['CECStandby', 'mute'])
+            second.resume()
+            self.assertEqual(commands, ['CECStandby', 'mute', 'unmute', 'CECActivateSource'])
+            self.assertFalse(second.journal.load())
+        finally:
+            kodiutils.run_builtin, turnoff.set_mute = run_builtin, set_mute
+            kodiutils.ADDON.settings.update(logoff='true')
+
+    def test_activation_stale_journal(self):
+        ''' Test reverting the state left behind by an interrupted activation instead of adopting it '''
+        kodiutils.ADDON.settings.update(display_method='1', power_method='0', logoff='false', mute='false')
+        turnoff.StateJournal(turnoff.JOURNAL_PATH).record(turnoff.STATE_DISPLAY_OFF, display=1)
+        commands = []
+        run_builtin = kodiutils.run_builtin
+        kodiutils.run_builtin = commands.append
+        try:
+            window = turnoff.TurnOffWindow()
+            window.activate()
+            self.assertFalse(window.lock.waited)
+            self.assertEqual(commands, ['CECActivateSource', 'CECStandby'])
+            window.resume()
+        finally:
+            kodiutils.run_builtin = run_builtin
+            kodiutils.ADDON.settings.update(display_method='0', logoff='true', mute='true')
+
+    def test_activation_failed_resume(self):
+        ''' Test releasing the activation lock when turning the display back on fails '''
+        kodiutils.ADDON.settings.update(display_method='1', power_method='0', logoff='false', mute='false')
+        commands = []
+
+        def failing_builtin(builtin):
+            commands.append(builtin)
+            if commands.count('CECActivateSource') == 1:
+                sys.exit(1)
+            return True
+
+        run_builtin = kodiutils.run_builtin
+        kodiutils.run_builtin = failing_builtin
+        try:
+            window = turnoff.TurnOffWindow()
+            window.activate()
+            with self.assertRaises(SystemExit):
+                window.resume()
+            self.assertTrue(window.resumed)
+            self.assertFalse(window.lock.owned)
+
+            # The next activation takes the lock without waiting, and reverts the state left behind
+            window = turnoff.TurnOffWindow()
+            start = time.time()
+            window.activate()
+            self.assertLess(time.time() - start, turnoff.LOCK_TIMEOUT / 2)
+            self.assertFalse(window.lock.waited)
+            self.assertEqual(commands, ['CECStandby', 'CECActivateSource', 'CECActivateSource', 'CECStandby'])
+            window.resume()
+        finally:
+            kodiutils.run_builtin = run_builtin
+            kodiutils.ADDON.settings.update(display_method='0', logoff='true', mute='true')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+# pylint: disable=invalid-name,missing-docstring
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import subprocess
+import sys
+import unittest
+import kodiutils
+import remote
+import turnoff
+from jsonrpcserver import JSONRPCServer
+
+
+class TestCLI(unittest.TestCase):
+
+    def setUp(self):
+        self.server = JSONRPCServer()
+        self.port = str(self.server.port)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_connection_pipeline(self):
+        ''' Test pipelining requests over a single persistent connection '''
+        connection = remote.JSONRPCConnection('127.0.0.1', self.server.port)
+        responses = connection.pipeline([dict(method='JSONRPC.Ping', id=7), dict(method='Application.GetProperties', params=dict(properties=['muted']))])
+        self.assertEqual(responses[0].get('result'), 'pong')
+        self.assertEqual(responses[0].get('id'), 7)
+        self.assertEqual(responses[1].get('result'), dict(muted=False))
+        self.assertEqual(connection.call(method='JSONRPC.Ping').get('result'), 'pong')
+        connection.close()
+        self.assertEqual(self.server.connections, 1)
+
+    def test_cli_status(self):
+        ''' Test reporting status '''
+        self.assertEqual(remote.cli(['status', '--host', '127.0.0.1', '--port', self.port]), 0)
+        self.assertEqual(self.server.methods(), ['JSONRPC.Ping', 'Application.GetProperties', 'XBMC.GetInfoBooleans'])
+
+    def test_cli_off_on(self):
+        ''' Test turning off and on using the method tables '''
+        self.assertEqual(remote.cli(['off', '--host', '127.0.0.1', '--port', self.port, '--mute', '--power', 'suspend-builtin']), 0)
+        self.assertEqual(remote.cli(['on', '--host', '127.0.0.1', '--port', self.port, '--mute']), 0)
+        self.assertEqual(self.server.methods(), ['Application.SetMute', 'System.Suspend', 'Application.SetMute'])
+
+    def test_cli_bench(self):
+        ''' Test benchmarking JSONRPC latency '''
+        kodiutils.ADDON.settings['display_method'] = '0'
+        kodiutils.ADDON.settings['power_method'] = '0'
+        self.assertEqual(remote.cli(['bench', '--host', '127.0.0.1', '--port', self.port, '--count', '10', '--activations', '2']), 0)
+        self.assertEqual(len(self.server.requests), 20)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_bench_activation(self):
+        ''' Test measuring time-to-first-command of both screensaver windows '''
+        kodiutils.ADDON.settings['display_method'] = '0'
+        kodiutils.ADDON.settings['power_method'] = '0'
+        for factory, start in [(lambda: turnoff.TurnOffDialog('gui.xml', kodiutils.ADDON_PATH, 'default'), 'onInit'),
+                               (turnoff.TurnOffWindow, 'activate')]:
+            timings = remote.bench_activation(factory, start, 3)
+            self.assertLessEqual(timings.get('min'), timings.get('max'))
+
+    def test_cli_errors(self):
+        ''' Test failing on builtin display methods and unreachable hosts '''
+        self.assertEqual(remote.cli(['off', '--host', '127.0.0.1', '--port', self.port, '--display', 'cec-builtin']), 1)
+        self.assertEqual(remote.cli(['off', '--host', '127.0.0.1', '--port', self.port, '--power', 'unknown']), 1)
+        self.server.stop()
+        self.server = JSONRPCServer()
+        self.assertEqual(remote.cli(['status', '--host', '127.0.0.1', '--port', self.port, '--timeout', '1']), 1)
+
+    def test_cli_outside_kodi(self):
+        ''' Test running the command-line interface without the Kodi modules '''
+        env = dict(os.environ, PYTHONPATH='')
+        output = subprocess.check_output([sys.executable, 'screensaver.py', 'status', '--host', '127.0.0.1', '--port', self.port], env=env)
+        self.assertIn(b'pong', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+# pylint: disable=invalid-name,missing-docstring
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import sys
+import tempfile
+import time
+import unittest
+from jsonrpcserver import JSONRPCServer
+
+try:
+    import asyncio
+    import fleet
+except (ImportError, SyntaxError):  # Python 2
+    fleet = None
+
+
+@unittest.skipIf(fleet is None or sys.version_info < (3, 7), 'Fleet mode requires Python 3.7+')
+class TestFleet(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = []
+        self.output = open(os.devnull, 'w')
+
+    def tearDown(self):
+        self.output.close()
+        for server in self.servers:
+            server.stop()
+
+    @staticmethod
+    def run_once(hosts, action, **kwargs):
+        return asyncio.run(fleet.run_action(hosts, action, **kwargs))
+
+    def start_servers(self, count, **kwargs):
+        servers = [JSONRPCServer(**kwargs) for _ in range(count)]
+        self.servers.extend(servers)
+        return [('127.0.0.1', server.port) for server in servers]
+
+    def test_read_inventory(self):
+        ''' Test reading a host inventory '''
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as fdesc:
+            fdesc.write('# Shop displays\nkodi1\nkodi2:8080  # Backroom\n\n')
+        try:
+            self.assertEqual(fleet.read_inventory(fdesc.name), [('kodi1', 9090), ('kodi2', 8080)])
+        finally:
+            os.remove(fdesc.name)
+
+    def test_fleet_reuses_connections(self):
+        ''' Test running several actions over one connection per host '''
+        hosts = self.start_servers(10)
+        success = asyncio.run(fleet.run_fleet(hosts, ['status', 'off', 'on'], power='suspend-builtin', mute=True, stream=self.output))
+        self.assertTrue(success)
+        for server in self.servers:
+            self.assertEqual(server.connections, 1)
+            self.assertEqual(server.methods(), ['JSONRPC.Ping', 'Application.GetProperties', 'XBMC.GetInfoBooleans',
+                                                'Addons.ExecuteAddon', 'Application.SetMute', 'System.Suspend',
+                                                'Application.SetMute', 'Input.Home'])
+
+    def test_fleet_screensaver(self):
+        ''' Test that off activates the screensaver through the script entry point and on deactivates it '''
+        hosts = self.start_servers(1)
+        self.assertTrue(self.run_once(hosts, 'off')[0].get('ok'))
+        self.assertEqual(self.run_once(hosts, 'status')[0].get('results')[-1], {'System.ScreenSaverActive': True})
+        self.assertTrue(self.run_once(hosts, 'on')[0].get('ok'))
+        self.assertEqual(self.run_once(hosts, 'status')[0].get('results')[-1], {'System.ScreenSaverActive': False})
+
+    def test_fleet_timeouts(self):
+        ''' Test reporting hosts that hang or are unreachable '''
+        hosts = self.start_servers(8) + self.start_servers(2, hang=True) + [('127.0.0.1', 1)]
+        results = self.run_once(hosts, 'status', timeout=0.5)
+        self.assertEqual(sum(result.get('ok') for result in results), 8)
+        self.assertFalse(fleet.report('status', results, stream=self.output))
+
+    def test_fleet_concurrency(self):
+        ''' Test bounding the number of hosts in flight '''
+        hosts = self.start_servers(8, latency=0.1)
+        start = time.time()
+        results = self.run_once(hosts, 'on', concurrency=2)
+        self.assertGreaterEqual(time.time() - start, 0.4)
+        self.assertTrue(all(result.get('ok') for result in results))
+
+    def test_fleet_main(self):
+        ''' Test the fleet command-line interface '''
+        hosts = self.start_servers(3)
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as fdesc:
+            fdesc.write('\n'.join('%s:%d' % host for host in hosts))
+        try:
+            self.assertEqual(fleet.main([fdesc.name, 'status']), 0)
+        finally:
+            os.remove(fdesc.name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+# pylint: disable=invalid-name,missing-docstring
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# NOTE: Cold start time in seconds, override using the IMPORT_BUDGET environment variable on slow systems
+IMPORT_BUDGET = float(os.environ.get('IMPORT_BUDGET', 0.1))
+
+# The Kodi modules are built into Kodi, so only the addon itself is measured
+# NOTE: Kodi compiles the entry point from source on every activation, like run_path() does
+MEASURE_IMPORT = '''
+import os, runpy, sys, time, xbmc, xbmcaddon, xbmcgui
+start = time.time()
+runpy.run_path(os.path.join(sys.argv[1], 'screensaver.py'), run_name='screensaver')
+import turnoff
+print(time.time() - start)
+'''
+
+
+class TestImport(unittest.TestCase):
+
+    def setUp(self):
+        ''' Copy the addon without its bytecode caches, so every run starts cold '''
+        self.directory = tempfile.mkdtemp()
+        shutil.copy('screensaver.py', self.directory)
+        shutil.copytree(os.path.join('resources', 'lib'), os.path.join(self.directory, 'resources', 'lib'),
+                        ignore=shutil.ignore_patterns('__pycache__', '*.pyc', '*.pyo'))
+        self.env = dict(os.environ, PYTHONPATH='test')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_import_budget(self):
+        ''' Test that a cold start of the screensaver stays within budget '''
+        timings = [float(subprocess.check_output([sys.executable, '-B', '-c', MEASURE_IMPORT, self.directory], env=self.env).split()[-1]) for _ in range(3)]
+        self.assertLess(min(timings), IMPORT_BUDGET, 'Starting screensaver took %.3fs, budget is %.3fs' % (min(timings), IMPORT_BUDGET))
+
+    def test_deferred_imports(self):
+        ''' Test that modules only needed by some methods are not imported up front '''
+        output = subprocess.check_output([sys.executable, '-B', '-c', MEASURE_IMPORT + 'print(sorted(sys.modules))', self.directory], env=self.env)
+        self.assertNotIn(b"'subprocess'", output)
+
+
+if __name__ == '__main__':
+    unittest.main()
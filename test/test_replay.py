@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+# pylint: disable=invalid-name,missing-docstring
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import kodiutils
+import turnoff
+import replay
+
+xbmc = __import__('xbmc')
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_record_and_replay(self):
+        ''' Test recording a slow activation cycle and reproducing its timing '''
+        xbmc.LATENCIES.update({'CECStandby': [0.2], 'Application.SetMute': [0.05, 0.05]})
+        kodiutils.ADDON.settings.update(display_method='1', power_method='0', logoff='false', mute='true')
+        os.environ['TURNOFF_TRACE'] = '1'
+        kodiutils.TRACE.directory = self.directory
+        try:
+            window = turnoff.TurnOffWindow()
+            window.activate()
+            time.sleep(0.1)
+            window.monitor.onScreensaverDeactivated()
+        finally:
+            del os.environ['TURNOFF_TRACE']
+            kodiutils.TRACE.directory = None
+            kodiutils.ADDON.settings.update(logoff='true')
+            xbmc.LATENCIES.clear()
+        path = os.path.join(self.directory, os.listdir(self.directory)[0])
+        header, recorded = replay.load_trace(path)
+        self.assertEqual(header.get('display'), 'cec-builtin')
+        self.assertEqual([event[1:3] for event in recorded], [
+            ['event', 'activate'],
+            ['run_builtin', 'CECStandby'],
+            ['jsonrpc', 'Application.GetProperties'],
+            ['jsonrpc', 'Application.SetMute'],
+            ['event', 'deactivated'],
+            ['jsonrpc', 'Application.SetMute'],
+            ['run_builtin', 'CECActivateSource'],
+            ['event', 'resume'],
+        ])
+        self.assertGreaterEqual(recorded[1][3], 0.2)
+
+        for kind, name, old_offset, new_offset, old_latency, new_latency in replay.compare(recorded, replay.replay(path)[1]):
+            self.assertAlmostEqual(old_offset, new_offset, delta=0.05, msg='%s %s' % (kind, name))
+            self.assertAlmostEqual(old_latency, new_latency, delta=0.05, msg='%s %s' % (kind, name))
+
+    def test_replay_failing_command(self):
+        ''' Test replaying a command that hung and then failed '''
+        path = os.path.join(self.directory, 'trace.jsonl')
+        with open(path, 'w') as fdesc:
+            fdesc.write(json.dumps(dict(version=1, display='no-signal-rpi', power='do-nothing', logoff='false', mute='false')) + '\n')
+            fdesc.write('[0.0,"event","activate",0,null]\n')
+            fdesc.write('[0.001,"run_command","vcgencmd display_power 0",0.3,"exit 2"]\n')
+        _, replayed = replay.replay(path)
+        self.assertEqual(replayed[1][1:3], ['run_command', 'vcgencmd display_power 0'])
+        self.assertEqual(replayed[1][4], 'exit 2')
+        self.assertGreaterEqual(replayed[1][3], 0.3)
+
+
+if __name__ == '__main__':
+    unittest.main()
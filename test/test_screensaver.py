@@ -5,9 +5,14 @@
 # pylint: disable=invalid-name,missing-docstring
 
 from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import shutil
+import tempfile
 import unittest
 import time
-import screensaver
+import kodiutils
+import tasks
+import turnoff
 
 xbmc = __import__('xbmc')
 xbmcaddon = __import__('xbmcaddon')
@@ -19,37 +24,314 @@ class TestScreensaver(unittest.TestCase):
     @staticmethod
     def test_screensaver_log():
         ''' Test enabling screensaver '''
-        screensaver.ADDON.settings['display_method'] = '0'
-        screensaver.ADDON.settings['power_method'] = '0'
-        turnoff = screensaver.TurnOffDialog('gui.xml', screensaver.ADDON_PATH, 'default')
-        turnoff.onInit()
+        kodiutils.ADDON.settings['display_method'] = '0'
+        kodiutils.ADDON.settings['power_method'] = '0'
+        window = turnoff.TurnOffDialog('gui.xml', kodiutils.ADDON_PATH, 'default')
+        window.onInit()
         time.sleep(5)
-        turnoff.resume()
+        window.resume()
 
     @staticmethod
     def test_screensaver_builtin():
         ''' Test enabling screensaver '''
-        screensaver.ADDON.settings['display_method'] = '1'
-        screensaver.ADDON.settings['power_method'] = '1'
-        turnoff = screensaver.TurnOffDialog('gui.xml', screensaver.ADDON_PATH, 'default')
-        turnoff.onInit()
+        kodiutils.ADDON.settings['display_method'] = '1'
+        kodiutils.ADDON.settings['power_method'] = '1'
+        window = turnoff.TurnOffDialog('gui.xml', kodiutils.ADDON_PATH, 'default')
+        window.onInit()
         time.sleep(5)
-        turnoff.resume()
+        window.resume()
+
+    def test_screensaver_window(self):
+        ''' Test turning off before the code-built window is shown '''
+        kodiutils.ADDON.settings['display_method'] = '0'
+        kodiutils.ADDON.settings['power_method'] = '0'
+        window = turnoff.TurnOffWindow()
+        window.run()
+        self.assertIsNotNone(window.cycle.display_off_time)
+        self.assertFalse(window.resumed)
+        window.monitor.onScreensaverDeactivated()
+        self.assertTrue(window.resumed)
 
     @unittest.expectedFailure
     def test_screensaver_command(self):
         ''' Test enabling screensaver '''
-        screensaver.ADDON.settings['display_method'] = '2'
-        screensaver.ADDON.settings['power_method'] = '2'
-        turnoff = screensaver.TurnOffDialog('gui.xml', screensaver.ADDON_PATH, 'default')
+        kodiutils.ADDON.settings['display_method'] = '2'
+        kodiutils.ADDON.settings['power_method'] = '2'
+        window = turnoff.TurnOffDialog('gui.xml', kodiutils.ADDON_PATH, 'default')
         with self.assertRaises(SystemExit) as init:
-            turnoff.onInit()
+            window.onInit()
         self.assertEqual(init.exception.code, 2)
         time.sleep(5)
         with self.assertRaises(SystemExit) as resume:
-            turnoff.resume()
+            window.resume()
         self.assertEqual(resume.exception.code, 2)
 
+    def test_mute_state(self):
+        ''' Test only muting and unmuting when the state has to change '''
+        kodiutils.ADDON.settings.update(display_method='0', power_method='0', logoff='false', mute='true')
+        methods = []
+        jsonrpc = turnoff.jsonrpc
+        turnoff.jsonrpc = lambda **kwargs: methods.append(kwargs.get('method')) or jsonrpc(**kwargs)
+        try:
+            # Audio that was muted before stays muted
+            xbmc.APPLICATION['muted'] = True
+            window = turnoff.TurnOffWindow()
+            window.activate()
+            window.resume()
+            self.assertEqual(methods, ['Application.GetProperties'])
+            self.assertTrue(xbmc.APPLICATION.get('muted'))
+
+            # Audio unmuted by the user in the meantime is not unmuted again
+            del methods[:]
+            xbmc.APPLICATION['muted'] = False
+            window = turnoff.TurnOffWindow()
+            window.activate()
+            self.assertTrue(xbmc.APPLICATION.get('muted'))
+            window.monitor.onNotification('xbmc', 'Application.OnVolumeChanged', '{"muted":false,"volume":100}')
+            window.resume()
+            self.assertEqual(methods, ['Application.GetProperties', 'Application.SetMute'])
+        finally:
+            turnoff.jsonrpc = jsonrpc
+            xbmc.APPLICATION['muted'] = False
+            kodiutils.ADDON.settings.update(logoff='true', mute='true')
+
+    def test_popup(self):
+        ''' Test queueing notifications without blocking, collapsing repeats and rate-limiting them '''
+        path = os.path.join(tempfile.mkdtemp(), 'notifications.json')
+        shown = []
+        notification = xbmcgui.Dialog.__dict__['notification']
+        xbmcgui.Dialog.notification = staticmethod(lambda heading, message, *args: time.sleep(0.2) or shown.append(message))
+        notifier = kodiutils.NOTIFIER
+        kodiutils.NOTIFIER = kodiutils.Notifier(path)
+        try:
+            start = time.time()
+            kodiutils.popup(msg='Also broken', key='vcgencmd')
+            self.assertLess(time.time() - start, 0.1)
+            # Queued while the first notification is still showing
+            time.sleep(0.05)
+            for _ in range(3):
+                kodiutils.popup(msg='Broken', key='CECStandby')
+            kodiutils.NOTIFIER.flush()
+            self.assertEqual(shown, ['Also broken', 'Broken (3x)'])
+
+            # Rate-limited per key
+            kodiutils.popup(msg='Broken', key='CECStandby')
+            kodiutils.NOTIFIER.flush()
+            self.assertEqual(len(shown), 2)
+
+            # Rate-limiting survives a new activation
+            kodiutils.NOTIFIER = kodiutils.Notifier(path)
+            kodiutils.popup(msg='Broken', key='CECStandby')
+            kodiutils.NOTIFIER.flush()
+            self.assertEqual(len(shown), 2)
+
+            # Suppressed notifications are counted in the next one shown
+            kodiutils.NOTIFIER = kodiutils.Notifier(path, interval=0)
+            kodiutils.popup(msg='Broken', key='CECStandby')
+            kodiutils.NOTIFIER.flush()
+            self.assertEqual(shown[2:], ['Broken (3x)'])
+        finally:
+            xbmcgui.Dialog.notification = notification
+            kodiutils.NOTIFIER = notifier
+            shutil.rmtree(os.path.dirname(path))
+
+    def test_popup_failing(self):
+        ''' Test notifications keep working after showing one failed '''
+        shown = []
+
+        def notify(heading, message, *args):  # pylint: disable=unused-argument
+            if message == 'Broken':
+                raise RuntimeError('Dialog unavailable')
+            shown.append(message)
+
+        notification = xbmcgui.Dialog.__dict__['notification']
+        xbmcgui.Dialog.notification = staticmethod(notify)
+        notifier = kodiutils.NOTIFIER
+        kodiutils.NOTIFIER = kodiutils.Notifier()
+        try:
+            kodiutils.popup(msg='Broken', key='CECStandby')
+            kodiutils.NOTIFIER.flush()
+            self.assertIsNone(kodiutils.NOTIFIER.worker)
+            kodiutils.popup(msg='Also broken', key='vcgencmd')
+            kodiutils.NOTIFIER.flush()
+            self.assertEqual(shown, ['Also broken'])
+        finally:
+            xbmcgui.Dialog.notification = notification
+            kodiutils.NOTIFIER = notifier
+
+    def test_power_off_tasks(self):
+        ''' Test running the tasks before powering off concurrently and within their deadline '''
+        kodiutils.ADDON.settings.update(display_method='0', power_method='1', logoff='false', mute='false',
+                                        commands='sleep 5; true', tasks_timeout='0.3')
+        xbmc.PLAYERS[:] = [dict(playerid=0, type='audio')]
+        methods = []
+        jsonrpc = kodiutils.jsonrpc
+        kodiutils.jsonrpc = lambda **kwargs: methods.append(kwargs.get('method')) or jsonrpc(**kwargs)
+        try:
+            window = turnoff.TurnOffWindow()
+            start = time.time()
+            window.activate()
+            self.assertLess(time.time() - start, 1)
+            self.assertEqual(xbmc.PLAYERS, [])
+            self.assertEqual(methods[-1], 'System.Suspend')
+            results = tasks.run_tasks(window.power_off_tasks())
+            self.assertEqual(results.get('sleep 5')[0], 'timeout')
+            self.assertEqual(results.get('true')[0], 'ok')
+            self.assertEqual(results.get('sync')[0], 'ok')
+            window.resume()
+        finally:
+            kodiutils.jsonrpc = jsonrpc
+            kodiutils.ADDON.settings.update(power_method='0', logoff='true', mute='true', commands='', tasks_timeout='5')
+
+    def test_verify_display_off(self):
+        ''' Test polling the display state until it is off '''
+        display = dict(name='test', verify=['echo', 'display_power=0'], verify_off='display_power=0')
+        self.assertTrue(tasks.verify_display_off(display, 0.2))
+        display.update(verify=['echo', 'display_power=1'])
+        start = time.time()
+        self.assertFalse(tasks.verify_display_off(display, 0.2))
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_telemetry(self):
+        ''' Test counting activation cycles and failures, and exporting them as a textfile '''
+        directory = tempfile.mkdtemp()
+        kodiutils.ADDON.settings.update(display_method='1', power_method='0', logoff='false', mute='false', telemetry='true', textfile_dir=directory)
+        telemetry_path = turnoff.TELEMETRY_PATH
+        turnoff.TELEMETRY_PATH = os.path.join(directory, 'telemetry.bin')
+
+        def executebuiltin(builtin, wait=False):  # pylint: disable=unused-argument
+            if builtin == 'CECStandby':
+                raise RuntimeError('CEC adapter not found')
+
+        builtin = kodiutils.executebuiltin
+        kodiutils.executebuiltin = executebuiltin
+        try:
+            for _ in range(2):
+                window = turnoff.TurnOffWindow()
+                window.activate()
+                time.sleep(0.1)
+                window.resume()
+            telemetry = turnoff.Telemetry(turnoff.TELEMETRY_PATH)
+            self.assertTrue(telemetry.load())
+            self.assertEqual((telemetry.cycles, telemetry.resumes), (2, 2))
+            self.assertEqual(telemetry.display[1][:2], [2, 2])
+            self.assertGreaterEqual(telemetry.display[1][2], 0.2)
+            self.assertEqual(telemetry.ring[1][3], turnoff.Telemetry.FAILED_DISPLAY | turnoff.Telemetry.RESUMED)
+            with open(os.path.join(directory, turnoff.TELEMETRY_TEXTFILE)) as fdesc:
+                textfile = fdesc.read()
+            # NOTE: The textfile is always rewritten on resume
+            self.assertIn('turnoff_display_activations_total{method="cec-builtin"} 2\n', textfile)
+            self.assertIn('turnoff_display_failures_total{method="cec-builtin"} 2\n', textfile)
+            self.assertIn('turnoff_resumes_total 2\n', textfile)
+            self.assertIn('turnoff_active 0\n', textfile)
+        finally:
+            kodiutils.executebuiltin = builtin
+            turnoff.TELEMETRY_PATH = telemetry_path
+            kodiutils.ADDON.settings.update(display_method='0', logoff='true', mute='true', telemetry='false', textfile_dir='')
+            shutil.rmtree(directory)
+
+    def test_telemetry_ring(self):
+        ''' Test keeping only the most recent cycles while counting all of them '''
+        directory = tempfile.mkdtemp()
+        try:
+            telemetry = turnoff.Telemetry(os.path.join(directory, 'telemetry.bin'))
+            for cycle in range(turnoff.TELEMETRY_RING + 6):
+                telemetry.activated(1, 1, cycle)
+                telemetry.resumed(10, 5)
+            telemetry.save()
+            loaded = turnoff.Telemetry(telemetry.path)
+            self.assertTrue(loaded.load())
+            self.assertEqual(len(loaded.ring), turnoff.TELEMETRY_RING)
+            self.assertEqual(loaded.ring[5][0], turnoff.TELEMETRY_RING + 5)
+            self.assertEqual(loaded.display[1], [turnoff.TELEMETRY_RING + 6, 0, 10.0 * (turnoff.TELEMETRY_RING + 6)])
+            self.assertEqual(loaded.power[1][2], 5.0 * (turnoff.TELEMETRY_RING + 6))
+            self.assertLess(os.path.getsize(telemetry.path), 2048)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_profile(self):
+        ''' Test profiling a single activation cycle '''
+        kodiutils.ADDON.settings['display_method'] = '0'
+        kodiutils.ADDON.settings['power_method'] = '0'
+        kodiutils.ADDON.settings['profile'] = 'true'
+        window = turnoff.TurnOffDialog('gui.xml', kodiutils.ADDON_PATH, 'default')
+        window.onInit()
+        window.resume()
+        self.assertEqual(kodiutils.ADDON.settings['profile'], 'false')
+        self.assertTrue([name for name in os.listdir(kodiutils.PROFILE_DIR) if name.endswith('.pstats')])
+
+    def test_rotate_files(self):
+        ''' Test rotating reports beyond a count or total size '''
+        directory = os.path.join(kodiutils.ADDON_PROFILE, 'rotate')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for index in range(5):
+            path = os.path.join(directory, 'report-%d' % index)
+            with open(path, 'w') as fdesc:
+                fdesc.write('x' * 100)
+            os.utime(path, (index, index))
+        kodiutils.rotate_files(directory, keep=3, max_size=1000)
+        self.assertEqual(sorted(os.listdir(directory)), ['report-2', 'report-3', 'report-4'])
+        kodiutils.rotate_files(directory, keep=3, max_size=150)
+        self.assertEqual(os.listdir(directory), ['report-4'])
+        os.remove(os.path.join(directory, 'report-4'))
+        os.rmdir(directory)
+
+    def test_next_wake_time(self):
+        ''' Test computing the next occurrence of a wall-clock time '''
+        now = time.mktime((2019, 11, 4, 7, 30, 0, 0, 0, -1))
+        self.assertEqual(tasks.next_wake_time('08:00', now=now), now + 30 * 60)
+        self.assertEqual(tasks.next_wake_time('07:00', now=now), now + 23.5 * 3600)
+        # The wake alarm at 07:50 would be in the past, so wake up tomorrow
+        now = time.mktime((2019, 11, 4, 7, 55, 0, 0, 0, -1))
+        self.assertEqual(tasks.next_wake_time('08:00', now=now, lead=600), now + 24 * 3600 + 5 * 60)
+        self.assertEqual(tasks.next_wake_time('08:00', now=now, lead=60), now + 5 * 60)
+
+    def test_wakealarm(self):
+        ''' Test programming the RTC wake alarm before suspending and warming up after wake up '''
+        rtc_root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(rtc_root, 'rtc0'))
+        wakealarm = os.path.join(rtc_root, 'rtc0', 'wakealarm')
+        open(wakealarm, 'w').close()
+        rtc_root_orig = tasks.RTC_ROOT
+        tasks.RTC_ROOT = rtc_root
+        kodiutils.ADDON.settings.update(display_method='0', power_method='1', wake='true', wake_time='08:00', wake_lead='10')
+        try:
+            window = turnoff.TurnOffWindow()
+            window.activate()
+            with open(wakealarm) as fdesc:
+                self.assertEqual(int(fdesc.read()), int(tasks.next_wake_time('08:00', lead=600)) - 600)
+            # Wake up after the scheduled time resumes immediately
+            window.cycle.wake_time = time.time() - 1
+            window.monitor.onNotification('xbmc', 'System.OnWake', '{}')
+            self.assertTrue(window.resumed)
+
+            # An invalid wake up time only skips scheduling the wake up
+            for wake_time, wake_lead in (('', '10'), ('25:00', '10'), ('08:00', 'ten')):
+                open(wakealarm, 'w').close()
+                kodiutils.ADDON.settings.update(wake_time=wake_time, wake_lead=wake_lead)
+                window = turnoff.TurnOffWindow()
+                window.activate()
+                self.assertIsNone(window.cycle.wake_time)
+                self.assertEqual(os.path.getsize(wakealarm), 0)
+                window.resume()
+                self.assertTrue(window.resumed)
+        finally:
+            kodiutils.ADDON.settings.update(power_method='0', wake='false', wake_time='08:00', wake_lead='10')
+            tasks.RTC_ROOT = rtc_root_orig
+            shutil.rmtree(rtc_root)
+
+    def test_warm_up(self):
+        ''' Test keeping the display off until the scheduled wake up time '''
+        kodiutils.ADDON.settings.update(display_method='0', power_method='0')
+        window = turnoff.TurnOffWindow()
+        window.activate()
+        window.cycle.wake_time = time.time() + 0.2
+        window.warm_up()
+        self.assertFalse(window.resumed)
+        time.sleep(0.5)
+        self.assertTrue(window.resumed)
+
 
 if __name__ == '__main__':
     unittest.main()
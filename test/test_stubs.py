@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Copyright: (c) 2019, Dag Wieers (@dagwieers) <dag@wieers.com>
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+# pylint: disable=invalid-name,missing-docstring
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import shutil
+import tempfile
+import unittest
+import xbmcextra
+
+xbmc = __import__('xbmc')
+
+
+class TestStubs(unittest.TestCase):
+
+    def setUp(self):
+        self.parsed = 0
+        self.cache_dir = xbmcextra.CACHE_DIR
+        xbmcextra.CACHE_DIR = tempfile.mkdtemp()
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        os.write(fd, b'test')
+        os.close(fd)
+
+    def tearDown(self):
+        shutil.rmtree(xbmcextra.CACHE_DIR)
+        xbmcextra.CACHE_DIR = self.cache_dir
+        os.remove(self.path)
+
+    def parse_count(self, path):
+        self.parsed += 1
+        with open(path) as f:
+            return f.read()
+
+    def test_localized_string(self):
+        ''' Test looking up translations in the msgctxt index '''
+        self.assertEqual(xbmc.getLocalizedString(33100), 'Display')
+        self.assertEqual(xbmc.getLocalizedString(1234), '<Untranslated>')
+
+    def test_cached(self):
+        ''' Test caching parsed files in memory and on disk, keyed by mtime '''
+        self.assertEqual(xbmcextra.cached(self.path, self.parse_count), 'test')
+        self.assertEqual(xbmcextra.cached(self.path, self.parse_count), 'test')
+        self.assertEqual(self.parsed, 1)
+        # A new process only has the disk cache
+        xbmcextra.CACHE.clear()
+        self.assertEqual(xbmcextra.cached(self.path, self.parse_count), 'test')
+        self.assertEqual(self.parsed, 1)
+        # A modified file is parsed again
+        with open(self.path, 'w') as f:
+            f.write('modified')
+        os.utime(self.path, (0, 0))
+        self.assertEqual(xbmcextra.cached(self.path, self.parse_count), 'modified')
+        self.assertEqual(self.parsed, 2)
+
+    def test_settings_copies(self):
+        ''' Test that modifying settings does not modify the cache '''
+        settings = xbmcextra.addon_settings('screensaver.turnoff')
+        settings['display_method'] = '9'
+        self.assertNotEqual(xbmcextra.addon_settings('screensaver.turnoff').get('display_method'), '9')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,14 +3,14 @@
 # GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
 ''' This file implements the Kodi xbmc module, either using stubs or alternative functionality '''
 
-# pylint: disable=invalid-name,no-self-use,unused-argument
+# pylint: disable=invalid-name,no-self-use,too-many-return-statements,unused-argument
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import os
 import json
 import time
-from xbmcextra import global_settings, import_language
+from xbmcextra import ADDON_INFO, global_settings, import_language
 
 LOGLEVELS = ['Debug', 'Info', 'Notice', 'Warning', 'Error', 'Severe', 'Fatal', 'None']
 LOGDEBUG = 0
@@ -31,6 +31,10 @@ REGIONS = {
     'dateshort': '%Y-%m-%d',
 }
 
+APPLICATION = dict(muted=False, screensaver=False, volume=100)
+PLAYERS = []
+# Latencies to inject per builtin or JSON-RPC method, see test/replay.py
+LATENCIES = {}
 GLOBAL_SETTINGS = global_settings()
 PO = import_language(language=GLOBAL_SETTINGS.get('locale.language'))
 
@@ -127,27 +131,87 @@ class VideoInfoTag(object):
         return 0
 
 
+def inject_latency(key):
+    ''' Sleep for the next injected latency of a builtin or JSON-RPC method '''
+    latencies = LATENCIES.get(key)
+    if latencies:
+        time.sleep(latencies.pop(0))
+
+
 def executebuiltin(string, wait=False):  # pylint: disable=unused-argument
     ''' A stub implementation of the xbmc executebuiltin() function '''
-    return
+    inject_latency(string)
+    if string == 'ActivateScreensaver':
+        APPLICATION['screensaver'] = True
+
+
+def run_addon(addonid, params=None):
+    ''' A stub implementation of the RunAddon builtin, only script extensions can be run '''
+    import runpy
+    import sys
+    info = next((info for info in ADDON_INFO.values() if info.get('id') == addonid), None)
+    if info is None:
+        return False
+    library = info.get('extensions').get('xbmc.python.script')
+    if library is None:
+        log("RunAddon cannot run addon '{addonid}'".format(addonid=addonid), LOGERROR)
+        return True
+    argv, sys.argv = sys.argv, [library] + list(params or [])
+    try:
+        runpy.run_path(library, run_name='__main__')
+    finally:
+        sys.argv = argv
+    return True
 
 
 def executeJSONRPC(jsonrpccommand):
     ''' A reimplementation of the xbmc executeJSONRPC() function '''
     command = json.loads(jsonrpccommand)
+    inject_latency(command.get('method'))
+    request_id = command.get('id', 1)
     if command.get('method') == 'Settings.GetSettingValue':
         key = command.get('params').get('setting')
-        return json.dumps(dict(id=1, jsonrpc='2.0', result=dict(value=GLOBAL_SETTINGS.get(key))))
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result=dict(value=GLOBAL_SETTINGS.get(key))))
     if command.get('method') == 'Addons.GetAddonDetails':
         if command.get('params', {}).get('addonid') == 'script.module.inputstreamhelper':
-            return json.dumps(dict(id=1, jsonrpc='2.0', result=dict(addon=dict(enabled='true', version='0.3.5'))))
-        return json.dumps(dict(id=1, jsonrpc='2.0', result=dict(addon=dict(enabled='true', version='1.2.3'))))
+            return json.dumps(dict(id=request_id, jsonrpc='2.0', result=dict(addon=dict(enabled='true', version='0.3.5'))))
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result=dict(addon=dict(enabled='true', version='1.2.3'))))
     if command.get('method') == 'Textures.GetTextures':
-        return json.dumps(dict(id=1, jsonrpc='2.0', result=dict(textures=[dict(cachedurl="", imagehash="", lasthashcheck="", textureid=4837, url="")])))
+        textures = [dict(cachedurl="", imagehash="", lasthashcheck="", textureid=4837, url="")]
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result=dict(textures=textures)))
     if command.get('method') == 'Textures.RemoveTexture':
-        return json.dumps(dict(id=1, jsonrpc='2.0', result="OK"))
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result="OK"))
+    if command.get('method') == 'JSONRPC.Ping':
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result='pong'))
+    if command.get('method') == 'Application.GetProperties':
+        properties = dict(muted=APPLICATION.get('muted'), volume=APPLICATION.get('volume'), name='Kodi', version=dict(major=18, minor=2))
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result={key: properties.get(key) for key in command.get('params').get('properties')}))
+    if command.get('method') == 'Application.SetMute':
+        mute = command.get('params').get('mute')
+        APPLICATION['muted'] = not APPLICATION.get('muted') if mute == 'toggle' else mute
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result=APPLICATION.get('muted')))
+    if command.get('method') == 'Player.GetActivePlayers':
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result=PLAYERS))
+    if command.get('method') == 'Player.Stop':
+        PLAYERS[:] = [player for player in PLAYERS if player.get('playerid') != command.get('params').get('playerid')]
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result='OK'))
+    if command.get('method') == 'XBMC.GetInfoBooleans':
+        booleans = {'System.ScreenSaverActive': APPLICATION.get('screensaver')}
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result={key: booleans.get(key, False) for key in command.get('params').get('booleans')}))
+    if command.get('method') == 'Addons.ExecuteAddon':
+        # NOTE: Like Kodi, only unknown addons are an error, other addons fail to run silently
+        if not run_addon(**command.get('params')):
+            return json.dumps(dict(error=dict(code=-32602, message='Invalid params.'), id=request_id, jsonrpc='2.0'))
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result='OK'))
+    if command.get('method') == 'Input.Home':
+        # NOTE: Any input deactivates the screensaver
+        APPLICATION['screensaver'] = False
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result='OK'))
+    if command.get('method') in ('GUI.ActivateWindow', 'Application.Quit',
+                                 'System.Hibernate', 'System.Powerdown', 'System.Reboot', 'System.Shutdown', 'System.Suspend'):
+        return json.dumps(dict(id=request_id, jsonrpc='2.0', result='OK'))
     log("executeJSONRPC does not implement method '{method}'".format(**command), LOGERROR)
-    return json.dumps(dict(error=dict(code=-1, message='Not implemented'), id=1, jsonrpc='2.0'))
+    return json.dumps(dict(error=dict(code=-1, message='Not implemented'), id=request_id, jsonrpc='2.0'))
 
 
 def getCondVisibility(string):  # pylint: disable=unused-argument
@@ -164,9 +228,9 @@ def getInfoLabel(key):
 
 def getLocalizedString(msgctxt):
     ''' A reimplementation of the xbmc getLocalizedString() function '''
-    for entry in PO:
-        if entry.msgctxt == '#%s' % msgctxt:
-            return entry.msgstr or entry.msgid
+    string = PO.get('#%s' % msgctxt)
+    if string is not None:
+        return string
     if int(msgctxt) >= 30000:
         log('Unable to translate #{msgctxt}'.format(msgctxt=msgctxt), LOGERROR)
     return '<Untranslated>'
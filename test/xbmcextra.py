@@ -7,8 +7,37 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 import os
-import xml.etree.ElementTree as ET
-import polib
+from copy import deepcopy
+
+CACHE_DIR = 'test/.cache'
+CACHE = {}
+
+
+def cached(path, parser):
+    ''' Parse a file once, caching the result in memory and on disk keyed by the file's mtime '''
+    import pickle
+    mtime = os.path.getmtime(path)
+    key = (path, parser.__name__)
+    if CACHE.get(key, (None,))[0] == mtime:
+        return CACHE.get(key)[1]
+    cache_path = os.path.join(CACHE_DIR, '%s.%s.pickle' % (path.replace(os.sep, '_'), parser.__name__))
+    try:
+        with open(cache_path, 'rb') as f:
+            cache_mtime, data = pickle.load(f)
+    except (EOFError, IOError, OSError, ValueError, pickle.UnpicklingError):
+        cache_mtime = None
+    if cache_mtime != mtime:
+        data = parser(path)
+        try:
+            if not os.path.isdir(CACHE_DIR):
+                os.makedirs(CACHE_DIR)
+            with open(cache_path, 'wb') as f:
+                # NOTE: Protocol 2 can be read by both Python 2 and Python 3
+                pickle.dump((mtime, data), f, 2)
+        except (IOError, OSError) as e:
+            print("Error: Cannot write cache '%s' : %s" % (cache_path, e))
+    CACHE[key] = (mtime, data)
+    return data
 
 
 def kodi_to_ansi(string):
@@ -38,8 +67,9 @@ def uri_to_path(uri):
     return ' \033[33m→ \033[34m%s\033[39;0m' % uri.replace('plugin://' + ADDON_ID, '')
 
 
-def read_addon_xml(path):
+def parse_addon_xml(path):
     ''' Parse the addon.xml and return an info dictionary '''
+    import xml.etree.ElementTree as ET
     info = dict(
         path='./',  # '/storage/.kodi/addons/plugin.video.vrt.nu',
         profile='special://userdata',  # 'special://profile/addon_data/plugin.video.vrt.nu/',
@@ -52,8 +82,12 @@ def read_addon_xml(path):
     info.update(root.attrib)  # Add 'id', 'name' and 'version'
     info['author'] = info.pop('provider-name')
 
+    info['extensions'] = {}
     for child in root:
         if child.attrib.get('point') != 'xbmc.addon.metadata':
+            # Add the library of every other extension point
+            if 'library' in child.attrib:
+                info['extensions'][child.attrib.get('point')] = child.attrib.get('library')
             continue
         for grandchild in child:
             # Handle assets differently
@@ -70,12 +104,22 @@ def read_addon_xml(path):
     return {info['name']: info}
 
 
+def read_addon_xml(path):
+    ''' Return the (cached) addon.xml info dictionary '''
+    return deepcopy(cached(path, parse_addon_xml))
+
+
+def parse_json(path):
+    ''' Parse a JSON file '''
+    import json
+    with open(path) as f:
+        return json.load(f)
+
+
 def global_settings():
     ''' Use the global_settings file '''
-    import json
     try:
-        with open('test/userdata/global_settings.json') as f:
-            settings = json.load(f)
+        settings = deepcopy(cached('test/userdata/global_settings.json', parse_json))
     except OSError as e:
         print("Error: Cannot use 'test/userdata/global_settings.json' : %s" % e)
         settings = {
@@ -102,10 +146,8 @@ def global_settings():
 
 def addon_settings(addon_id=None):
     ''' Use the addon_settings file '''
-    import json
     try:
-        with open('test/userdata/addon_settings.json') as f:
-            settings = json.load(f)
+        settings = deepcopy(cached('test/userdata/addon_settings.json', parse_json))
     except OSError as e:
         print("Error: Cannot use 'test/userdata/addon_settings.json' : %s" % e)
         settings = {}
@@ -116,9 +158,15 @@ def addon_settings(addon_id=None):
     return settings
 
 
+def parse_po(path):
+    ''' Index the language.po file by msgctxt '''
+    import polib
+    return {entry.msgctxt: entry.msgstr or entry.msgid for entry in polib.pofile(path) if entry.msgctxt}
+
+
 def import_language(language):
-    ''' Process the language.po file '''
-    return polib.pofile('resources/language/{language}/strings.po'.format(language=language))
+    ''' Process the language.po file, returns a msgctxt to string dictionary '''
+    return cached('resources/language/{language}/strings.po'.format(language=language), parse_po)
 
 
 ADDON_INFO = read_addon_xml('addon.xml')
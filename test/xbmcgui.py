@@ -218,6 +218,17 @@ class Window(object):
         ''' A stub implementation for the xbmcgui Window class show() method '''
 
 
+class WindowDialog(Window, object):
+    ''' A reimplementation of the xbmcgui WindowDialog '''
+
+    def __init__(self):
+        ''' A stub constructor for the xbmcgui WindowDialog class '''
+        super(WindowDialog, self).__init__()
+
+    def doModal(self):
+        ''' A stub implementation for the xbmcgui WindowDialog class doModal() method '''
+
+
 class WindowXML(Window, object):
     ''' A reimplementation of the xbmcgui WindowXML '''
 